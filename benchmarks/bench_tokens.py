@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+NAME
+    bench_tokens - benchmark tokenization throughput and memory use
+
+SYNOPSIS
+    python benchmarks/bench_tokens.py [options]
+
+DESCRIPTION
+    bench_tokens generates deterministic synthetic corpora and measures
+    how fast count_tokens_in_file, head_tokens_text and
+    num_tokens_from_messages process them for each model.
+
+    The corpora are ASCII prose, source code, CJK text, emoji-heavy
+    text, one huge file and many tiny files. The same seed and scale
+    always produce the same bytes, so results from different runs are
+    comparable.
+
+    Every case runs in its own Python process, so its peak resident
+    set size is measured on its own. For each case the best wall time
+    of --repeat runs is reported, along with MB/s, tokens/s and peak
+    RSS. Results are written as JSON.
+
+    With --compare, results are checked against an earlier results
+    file, and bench_tokens exits with status 1 if any case got slower,
+    or used more memory, by more than --threshold.
+
+    No network access is needed once the tiktoken encodings have been
+    downloaded into the tiktoken cache (see TIKTOKEN_CACHE_DIR).
+
+OPTIONS
+    --output FILE
+        Write results to FILE. Defaults to standard output.
+
+    --compare BASELINE
+        Compare results against the results file BASELINE.
+
+    --threshold FRACTION
+        Allowed slowdown or memory growth before a case counts as a
+        regression. Defaults to 0.10.
+
+    --scale N
+        Multiply the size of every corpus by N. Defaults to 1, which
+        makes the huge file about 64 MB.
+
+    --repeat N
+        Run each case N times and report the fastest. Defaults to 3.
+
+    --model MODEL_NAME
+        Benchmark MODEL_NAME. May be given more than once. Defaults to
+        every model with a known chat message format.
+
+    --corpus CORPUS
+        Benchmark only CORPUS. May be given more than once.
+
+    --function FUNCTION
+        Benchmark only FUNCTION. May be given more than once.
+
+    --corpus-dir DIR
+        Generate corpora in DIR and keep them. Defaults to a temporary
+        directory that is removed afterwards.
+
+EXAMPLES
+    Record a baseline, then check a change against it:
+    python benchmarks/bench_tokens.py --output baseline.json
+    python benchmarks/bench_tokens.py --compare baseline.json --threshold 0.05
+
+    Benchmark only head on the huge file for one model:
+    python benchmarks/bench_tokens.py --corpus huge --function head_tokens_text --model gpt-4-0314
+
+DATE
+    2026-10-17
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai_misc_tools import openai_tokens
+
+# Define constants
+SEED = 20231017
+MB = 1024 * 1024
+HEAD_TOKENS = 1000
+DEFAULT_THRESHOLD = 0.10
+DEFAULT_REPEAT = 3
+FUNCTIONS = ['count_tokens_in_file', 'head_tokens_text', 'num_tokens_from_messages']
+
+WORDS = ('the of and to in is that it was for on are as with his they at be this from have or by one had '
+         'not but what all were when we there can an your which their said if do will each about how up '
+         'out them then she many some so these would other into has more her two like him see time could '
+         'tokenization benchmark throughput memory encoding stream chunk boundary transcript').split()
+CODE_LINES = [
+    'def {name}(self, {arg}):',
+    '    """Returns the {name} of {arg}."""',
+    '    if {arg} is None:',
+    '        return {{}}',
+    '    for i in range(len({arg})):',
+    '        total += {arg}[i] * 0x{num:04x}',
+    '    return [x for x in {arg} if x != "{name}"]',
+    '',
+    '# {name}: {arg} -> {num}',
+    'class {cls}({cls}Base):',
+]
+CJK = ''.join(chr(c) for c in range(0x4E00, 0x4E00 + 2000)) + '。、「」？！' + ''.join(chr(c) for c in range(0x3041, 0x3097))
+EMOJI = [chr(c) for c in range(0x1F600, 0x1F650)] + ['👍🏽', '👩‍💻', '🇺🇸', '❤️', '✨']
+
+def prose(rng, size):
+    sentences = []
+    length = 0
+    while length < size:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 20)))
+        sentence = sentence.capitalize() + rng.choice(['.', '.', '.', '?', '!'])
+        if rng.random() < 0.15:
+            sentence += '\n\n'
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return ' '.join(sentences)[:size]
+
+def code(rng, size):
+    lines = []
+    length = 0
+    while length < size:
+        line = rng.choice(CODE_LINES).format(name=rng.choice(WORDS), arg=rng.choice(WORDS) + '_list',
+                                             num=rng.randrange(65536), cls=rng.choice(WORDS).capitalize())
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines)[:size]
+
+def cjk(rng, size):
+    text = []
+    length = 0
+    while length < size:
+        line = ''.join(rng.choice(CJK) for _ in range(rng.randint(20, 80))) + '\n'
+        text.append(line)
+        length += len(line.encode('utf-8'))
+    return ''.join(text)
+
+def emoji(rng, size):
+    text = []
+    length = 0
+    while length < size:
+        piece = rng.choice(EMOJI) if rng.random() < 0.4 else rng.choice(WORDS)
+        text.append(piece)
+        length += len(piece.encode('utf-8')) + 1
+    return ' '.join(text)
+
+# Corpus name -> (text generator, number of files, bytes per file at scale 1)
+CORPORA = {
+    'prose': (prose, 1, 4 * MB),
+    'code': (code, 1, 4 * MB),
+    'cjk': (cjk, 1, 4 * MB),
+    'emoji': (emoji, 1, 4 * MB),
+    'huge': (prose, 1, 64 * MB),
+    'tiny': (prose, 2000, 512),
+}
+
+def generate_corpus(directory, name, scale):
+    """Writes the corpus name into directory, returning the list of its file paths."""
+    generator, num_files, size = CORPORA[name]
+    corpus_dir = os.path.join(directory, name)
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = random.Random(f"{SEED}-{name}")
+    paths = []
+    for i in range(num_files):
+        path = os.path.join(corpus_dir, f"{i:05d}.txt")
+        if not os.path.exists(path):
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(generator(rng, int(size * scale)))
+        paths.append(path)
+    return paths
+
+def run_once(function, model, paths):
+    """Runs function over paths once, returning the number of tokens it saw."""
+    tokens = 0
+    for path in paths:
+        with open(path, encoding='utf-8') as file:
+            if function == 'count_tokens_in_file':
+                tokens += openai_tokens.count_tokens_in_file(file, model)
+            elif function == 'head_tokens_text':
+                head_text = openai_tokens.head_tokens_text(file.read(), model, HEAD_TOKENS)
+                tokens += openai_tokens.get_token_counter(model).count(head_text)
+            else:
+                messages = [{"role": "system", "content": "You are a helpful assistant."},
+                            {"role": "user", "content": file.read()}]
+                tokens += openai_tokens.num_tokens_from_messages(messages, model)
+    return tokens
+
+def run_case(case):
+    """Runs one benchmark case in this process and returns its result."""
+    # Load the encoding before timing, as a long-running caller would have
+    openai_tokens.get_token_counter(case['model'])
+    best = None
+    for _ in range(case['repeat']):
+        start = time.perf_counter()
+        tokens = run_once(case['function'], case['model'], case['paths'])
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    size = sum(os.path.getsize(path) for path in case['paths'])
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss_kb //= 1024
+    return {
+        'corpus': case['corpus'],
+        'function': case['function'],
+        'model': case['model'],
+        'files': len(case['paths']),
+        'bytes': size,
+        'tokens': tokens,
+        'seconds': best,
+        'mb_per_s': size / MB / best if best else None,
+        'tokens_per_s': tokens / best if best else None,
+        'peak_rss_kb': peak_rss_kb,
+    }
+
+def run_case_in_subprocess(case):
+    """Runs one benchmark case in a fresh Python process, so its peak RSS is its own."""
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-case', json.dumps(case)],
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output)
+
+def case_key(result):
+    return (result['corpus'], result['function'], result['model'])
+
+def compare(results, baseline, threshold):
+    """Prints how each result changed from baseline, returning the number of regressions."""
+    previous = {case_key(result): result for result in baseline['results']}
+    regressions = 0
+    for result in results['results']:
+        before = previous.get(case_key(result))
+        if before is None:
+            continue
+        time_change = result['seconds'] / before['seconds'] - 1
+        rss_change = result['peak_rss_kb'] / before['peak_rss_kb'] - 1
+        regressed = time_change > threshold or rss_change > threshold
+        regressions += regressed
+        print(f"{'REGRESSION' if regressed else 'ok':<10} {'/'.join(case_key(result))}: "
+              f"time {time_change:+.1%}, peak RSS {rss_change:+.1%}", file=sys.stderr)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tokenization throughput and memory use.')
+    parser.add_argument('--output', help='write results to this file (default: standard output)')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare results against this results file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed slowdown or memory growth (default: {})'.format(DEFAULT_THRESHOLD))
+    parser.add_argument('--scale', type=float, default=1, help='multiply the size of every corpus (default: 1)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='run each case this many times and report the fastest (default: {})'.format(DEFAULT_REPEAT))
+    parser.add_argument('--model', action='append', help='a model to benchmark (default: all)')
+    parser.add_argument('--corpus', action='append', choices=sorted(CORPORA), help='a corpus to benchmark (default: all)')
+    parser.add_argument('--function', action='append', choices=FUNCTIONS, help='a function to benchmark (default: all)')
+    parser.add_argument('--corpus-dir', help='generate corpora in this directory and keep them')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return
+
+    models = args.model or sorted(openai_tokens.MESSAGE_FORMATS)
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix='bench_tokens-')
+    try:
+        results = []
+        for corpus in args.corpus or CORPORA:
+            paths = generate_corpus(corpus_dir, corpus, args.scale)
+            for function in args.function or FUNCTIONS:
+                for model in models:
+                    case = {'corpus': corpus, 'function': function, 'model': model,
+                            'paths': paths, 'repeat': args.repeat}
+                    result = run_case_in_subprocess(case)
+                    print(f"{corpus:<6} {function:<25} {model:<20} {result['seconds']:8.3f}s "
+                          f"{result['mb_per_s']:8.2f} MB/s {result['tokens_per_s']:12.0f} tokens/s "
+                          f"{result['peak_rss_kb'] / 1024:8.1f} MB RSS", file=sys.stderr)
+                    results.append(result)
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_dir)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=4)
+            output.write('\n')
+    else:
+        print(json.dumps(report, indent=4))
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+NAME
+    check_chunk_plan - check openai-transcribe's chunk planner offline
+
+SYNOPSIS
+    python benchmarks/check_chunk_plan.py [options]
+
+DESCRIPTION
+    check_chunk_plan runs plan_chunks() over seeded random recordings:
+    a duration, a bitrate and a list of pauses, with no audio at all.
+    For each plan it checks that:
+
+    - the chunks follow each other from the start of the audio to its
+      end, with no gap or overlap;
+    - there are as few chunks as the upload limit allows;
+    - no chunk holds more than the upload limit;
+    - no chunk of several is shorter than a quarter of the limit;
+    - every cut is in the middle of a pause if there is a pause close
+      enough before the cut's even share of the audio, and at that
+      point exactly if there is none.
+
+    With --audio, it also makes a tone broken by a pause every few
+    seconds with ffmpeg, runs detect_silences() on it and checks that
+    the pauses found are the ones put in, and that a plan made from
+    them cuts only inside pauses. This is skipped if ffmpeg is not
+    installed.
+
+    It prints one line per check and exits with status 1 if any fails.
+
+OPTIONS
+    --cases N
+        Number of random recordings to plan. Defaults to 2000.
+
+    --seed N
+        Seed for the random recordings. Defaults to 1.
+
+    --audio
+        Also check detect_silences() on synthetic audio.
+
+EXAMPLES
+    Check the planner, with pause detection on real audio:
+    python benchmarks/check_chunk_plan.py --audio
+
+DATE
+    2026-10-17
+"""
+
+import argparse
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Define constants
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from openai_misc_tools import openai_transcribe_plan  # noqa: E402
+
+DEFAULT_CASES = 2000
+DEFAULT_SEED = 1
+BYTES_PER_SECOND = 4000  # compact mono 16 kHz audio at 32 kbit/s
+TOLERANCE = 1e-6
+AUDIO_SECONDS = 120
+AUDIO_PAUSE_EVERY = 7
+AUDIO_PAUSE_LENGTH = 0.5
+AUDIO_MAX_BYTES = 50 * BYTES_PER_SECOND  # small enough to cut two minutes of audio into three chunks
+AUDIO_WINDOW = 10.0
+
+def plan_problems(duration, bytes_per_second, silences, max_bytes, window):
+    """Returns a list of the ways the plan for one recording breaks the planner's promises."""
+    chunks = openai_transcribe_plan.plan_chunks(duration, bytes_per_second, silences, max_bytes, window)
+    max_length = max_bytes / bytes_per_second
+    problems = []
+    position = 0.0
+    for start, length in chunks:
+        if abs(start - position) > TOLERANCE:
+            problems.append(f"chunk at {start} does not follow on from {position}")
+        position = start + length
+    if abs(position - duration) > TOLERANCE:
+        problems.append(f"chunks end at {position}, not {duration}")
+    fewest = max(math.ceil(duration / max_length), 1)
+    if len(chunks) != fewest:
+        problems.append(f"{len(chunks)} chunks where {fewest} would do")
+    for start, length in chunks:
+        if length * bytes_per_second > max_bytes + TOLERANCE:
+            problems.append(f"chunk at {start} holds {length * bytes_per_second:.0f} bytes")
+        if len(chunks) > 1 and length < max_length / 4 - TOLERANCE:
+            problems.append(f"chunk at {start} is only {length} seconds long")
+
+    # Each cut is at a pause whenever one lies between the earliest cut allowed and the even share
+    midpoints = sorted((start + end) / 2 for start, end in silences)
+    for i, (start, length) in enumerate(chunks[:-1]):
+        left = duration - start
+        count = math.ceil(left / max_length)
+        limit = start + left / count
+        earliest = max(limit - min(window, (limit - start) / 2), duration - (count - 1) * max_length)
+        candidates = [cut for cut in midpoints if earliest <= cut <= limit]
+        cut = start + length
+        expected = candidates[-1] if candidates else limit
+        if abs(cut - expected) > TOLERANCE:
+            problems.append(f"cut {i + 1} is at {cut}, not at {expected}")
+    return problems
+
+def random_recording(rng, max_length):
+    """Returns (duration, silences) for a random recording up to ten times the longest chunk."""
+    duration = rng.choice([rng.uniform(0, max_length), rng.uniform(0, 10 * max_length),
+                           max_length * rng.randint(1, 10) + rng.choice([-1e-7, 0, 1e-7, 1])])
+    silences = []
+    time = rng.expovariate(1 / 20)
+    spacing = rng.choice([5, 20, 120, 1000])
+    while time < duration:
+        length = rng.uniform(0.3, 3)
+        silences.append((time, min(time + length, duration)))
+        time += length + rng.expovariate(1 / spacing)
+    return duration, silences
+
+def check_plans(cases, seed):
+    """Checks plan_chunks on random recordings, returning the number that failed."""
+    rng = random.Random(seed)
+    max_bytes = openai_transcribe_plan.MAX_CHUNK_BYTES
+    window = openai_transcribe_plan.SILENCE_WINDOW
+    failures = 0
+    for case in range(cases):
+        duration, silences = random_recording(rng, max_bytes / BYTES_PER_SECOND)
+        problems = plan_problems(duration, BYTES_PER_SECOND, silences, max_bytes, window)
+        if problems:
+            failures += 1
+            if failures <= 5:
+                print(f"FAIL case {case}: {duration} seconds, {len(silences)} pauses: {'; '.join(problems)}")
+    print(f"{'ok' if not failures else 'FAIL':<4} plan_chunks on {cases} random recordings"
+          + (f": {failures} failed" if failures else ''))
+    return failures
+
+def check_audio():
+    """Checks detect_silences and plan_chunks on a synthetic tone with regular pauses, returning 1 if it fails."""
+    if shutil.which('ffmpeg') is None:
+        print("skip detect_silences: ffmpeg is not installed")
+        return 0
+    directory = tempfile.mkdtemp(prefix='check-chunk-plan-')
+    try:
+        filename = os.path.join(directory, 'tone.wav')
+        expression = f"sin(440*2*PI*t)*gte(mod(t,{AUDIO_PAUSE_EVERY}),{AUDIO_PAUSE_LENGTH})"
+        subprocess.run(['ffmpeg', '-loglevel', 'error', '-f', 'lavfi', '-i',
+                        f"aevalsrc='{expression}':s=16000:d={AUDIO_SECONDS}", filename], check=True)
+        silences = openai_transcribe_plan.detect_silences(filename, AUDIO_SECONDS)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    problems = []
+    expected = list(range(0, AUDIO_SECONDS, AUDIO_PAUSE_EVERY))
+    found = [start for start, _ in silences]
+    if len(found) != len(expected) or any(abs(start - pause) > 0.05 for start, pause in zip(found, expected)):
+        problems.append(f"pauses found at {[round(start, 2) for start in found]}, not at {expected}")
+    chunks = openai_transcribe_plan.plan_chunks(AUDIO_SECONDS, BYTES_PER_SECOND, silences, AUDIO_MAX_BYTES, AUDIO_WINDOW)
+    for start, _ in chunks[1:]:
+        if not any(silence_start <= start <= silence_end for silence_start, silence_end in silences):
+            problems.append(f"cut at {start} is not in a pause")
+    problems.extend(plan_problems(AUDIO_SECONDS, BYTES_PER_SECOND, silences, AUDIO_MAX_BYTES, AUDIO_WINDOW))
+    print(f"{'ok' if not problems else 'FAIL':<4} detect_silences and plan_chunks on {AUDIO_SECONDS} seconds of synthetic audio"
+          + (f": {'; '.join(problems)}" if problems else ''))
+    return 1 if problems else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Check openai-transcribe's chunk planner offline.")
+    parser.add_argument('--cases', type=int, default=DEFAULT_CASES,
+                        help='the number of random recordings to plan (default: {})'.format(DEFAULT_CASES))
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED,
+                        help='the seed for the random recordings (default: {})'.format(DEFAULT_SEED))
+    parser.add_argument('--audio', action='store_true', help='also check detect_silences on synthetic audio')
+    args = parser.parse_args()
+
+    failures = check_plans(args.cases, args.seed)
+    if args.audio:
+        failures += check_audio()
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
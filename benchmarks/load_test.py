@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+NAME
+    load_test - drive the tools against the mock OpenAI server and report throughput and latency
+
+SYNOPSIS
+    python benchmarks/load_test.py [options] [mock server options]
+
+DESCRIPTION
+    load_test starts benchmarks/mock_openai_server.py on a free local
+    port, passing it every option load_test does not know itself, and
+    runs each scenario against it with a throwaway configuration file
+    and cache directory. No network access or API key is needed.
+
+    The scenarios are:
+
+    chat        openai-chat, one process per request
+    stream      openai-chat --stream, one process per request, also
+                timing the first token
+    models      openai-chat --list-models, one process per request
+    batch       openai-chat --batch over --requests records at once,
+                with --jobs set to --concurrency
+    client      AsyncClient.chat in this process, --concurrency
+                requests at a time
+    transcribe  openai-transcribe --jobs --concurrency over --files
+                synthetic recordings made with ffmpeg; skipped if
+                ffmpeg is not installed
+
+    For each scenario it reports the operations run and failed, the
+    wall time, throughput, latency percentiles, the API requests and
+    retries the tools counted with --metrics, and the requests and
+    injected errors the server saw. Results can also be written as
+    JSON.
+
+OPTIONS
+    --scenario NAME
+        Run scenario NAME. May be given more than once. Defaults to
+        every scenario.
+
+    --requests N
+        Operations per scenario. Defaults to 40.
+
+    --concurrency N
+        Operations in flight at once. Defaults to 8.
+
+    --files N
+        Recordings for the transcribe scenario. Defaults to 4.
+
+    --audio-seconds SECONDS
+        Length of each recording. Defaults to 120.
+
+    --base-url URL
+        Use the mock server already running at URL instead of starting
+        one.
+
+    --output FILE
+        Write the results to FILE as JSON.
+
+EXAMPLES
+    Load-test every scenario against a healthy service:
+    python benchmarks/load_test.py
+
+    See how batch mode copes with rate limits and slow replies:
+    python benchmarks/load_test.py --scenario batch --requests 200 --concurrency 32 --latency lognormal:1,0.5 --rate-limit-rate 0.2 --retry-after 0.5
+
+DATE
+    2026-10-17
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# Define constants
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK_SERVER = os.path.join(ROOT, 'benchmarks', 'mock_openai_server.py')
+SCENARIOS = ['chat', 'stream', 'models', 'batch', 'client', 'transcribe']
+DEFAULT_REQUESTS = 40
+DEFAULT_CONCURRENCY = 8
+DEFAULT_FILES = 4
+DEFAULT_AUDIO_SECONDS = 120
+PERCENTILES = [50, 90, 99]
+FIRST_TOKEN_LINE = re.compile(r'time to first token: ([0-9.]+)s')
+
+def percentile(values, p):
+    """Returns the pth percentile of values, interpolating between the nearest ranks, or None if values is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def latency_summary(latencies):
+    """Returns the percentiles, mean and maximum of latencies in seconds, as a dict."""
+    summary = {f"p{p}": percentile(latencies, p) for p in PERCENTILES}
+    summary["mean"] = sum(latencies) / len(latencies) if latencies else None
+    summary["max"] = max(latencies) if latencies else None
+    return summary
+
+def fetch_json(url, data=None):
+    """Returns the JSON response to a GET request to url, or a POST request if data is given."""
+    with urllib.request.urlopen(url, data=data, timeout=10) as response:
+        return json.load(response)
+
+class Environment:
+    """The mock server, configuration file and cache directory the scenarios run with."""
+
+    def __init__(self, server_args, base_url=None):
+        self.directory = tempfile.mkdtemp(prefix='load-test-')
+        self.server = None
+        if base_url is None:
+            self.server = subprocess.Popen([sys.executable, MOCK_SERVER, '--quiet'] + server_args,
+                                           stdout=subprocess.PIPE, universal_newlines=True)
+            base_url = self.server.stdout.readline().strip()
+            if not base_url:
+                raise RuntimeError('the mock server did not start')
+        self.base_url = base_url.rstrip('/')
+        self.config_file = os.path.join(self.directory, 'openai.conf')
+        with open(self.config_file, 'w') as file:
+            file.write(f"[default]\napi_key = sk-load-test\napi_base = {self.base_url}\n")
+        self.env = dict(os.environ, OPENAI_CONFIG=self.config_file, XDG_CACHE_HOME=os.path.join(self.directory, 'cache'),
+                        PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+        self.server_root = self.base_url[:-len('/v1')] if self.base_url.endswith('/v1') else self.base_url
+
+    def reset_stats(self):
+        fetch_json(self.server_root + '/_stats/reset', data=b'')
+
+    def stats(self):
+        return fetch_json(self.server_root + '/_stats')
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def close(self):
+        if self.server is not None:
+            self.server.terminate()
+            self.server.wait()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def run_tool(environment, module, arguments, metrics_file):
+    """Runs a console script module with arguments, returning (seconds, exit status, standard output, standard error)."""
+    command = [sys.executable, '-m', f"openai_misc_tools.{module}", '--metrics', metrics_file] + arguments
+    start = time.perf_counter()
+    result = subprocess.run(command, env=environment.env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    return time.perf_counter() - start, result.returncode, result.stdout, result.stderr
+
+def read_counters(metrics_file):
+    """Returns the counters of every run recorded in a metrics file, added up."""
+    totals = {}
+    if os.path.exists(metrics_file):
+        with open(metrics_file) as file:
+            for line in file:
+                for name, value in json.loads(line)["counters"].items():
+                    totals[name] = totals.get(name, 0) + value
+    return totals
+
+def run_processes(environment, module, arguments, args, metrics_file):
+    """Runs --requests invocations of a tool, --concurrency at a time, returning the scenario's results."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        runs = list(executor.map(lambda _: run_tool(environment, module, arguments, metrics_file), range(args.requests)))
+    results = {"operations": args.requests, "failed": sum(1 for _, status, _, _ in runs if status != 0),
+               "latency": latency_summary([seconds for seconds, _, _, _ in runs])}
+    first_tokens = [float(match.group(1)) for _, _, _, stderr in runs for match in FIRST_TOKEN_LINE.finditer(stderr)]
+    if first_tokens:
+        results["time_to_first_token"] = latency_summary(first_tokens)
+    return results
+
+def chat_scenario(environment, args, metrics_file):
+    return run_processes(environment, 'openai_chat', ['--user', 'Why is the sky blue?'], args, metrics_file)
+
+def stream_scenario(environment, args, metrics_file):
+    return run_processes(environment, 'openai_chat', ['--stream', '--user', 'Why is the sky blue?'], args, metrics_file)
+
+def models_scenario(environment, args, metrics_file):
+    return run_processes(environment, 'openai_chat', ['--list-models'], args, metrics_file)
+
+def batch_scenario(environment, args, metrics_file):
+    batch_file = environment.path('batch.jsonl')
+    with open(batch_file, 'w') as file:
+        for i in range(args.requests):
+            file.write(json.dumps({"id": i, "messages": [{"role": "user", "content": f"Question number {i}?"}]}) + '\n')
+    _, _, stdout, _ = run_tool(environment, 'openai_chat', ['--batch', batch_file, '--jobs', str(args.concurrency)],
+                               metrics_file)
+    # One process answers every record, so there is no latency per record to report
+    results = [json.loads(line) for line in stdout.splitlines() if line.strip()]
+    failed = args.requests - len(results) + sum(1 for result in results if "error" in result)
+    return {"operations": args.requests, "failed": failed, "latency": latency_summary([])}
+
+def client_scenario(environment, args, metrics_file):
+    sys.path.insert(0, ROOT)
+    from openai_misc_tools import openai_metrics
+    from openai_misc_tools.openai_client import AsyncClient
+    recorder = openai_metrics.enable('load-test')
+
+    async def run():
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        async with AsyncClient('sk-load-test', api_base=environment.base_url, connections=args.concurrency) as client:
+            async def one(i):
+                async with semaphore:
+                    start = time.perf_counter()
+                    await client.chat([{"role": "user", "content": f"Question number {i}?"}])
+                    latencies.append(time.perf_counter() - start)
+            outcomes = await asyncio.gather(*(one(i) for i in range(args.requests)), return_exceptions=True)
+        return latencies, sum(1 for outcome in outcomes if isinstance(outcome, Exception))
+
+    latencies, failed = asyncio.run(run())
+    recorder.write(metrics_file)
+    return {"operations": args.requests, "failed": failed, "latency": latency_summary(latencies)}
+
+def transcribe_scenario(environment, args, metrics_file):
+    if shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None:
+        return None
+    files = []
+    for i in range(args.files):
+        path = environment.path(f"recording-{i}.mp3")
+        subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-f', 'lavfi',
+                        '-i', f"sine=frequency={300 + 40 * i}:duration={args.audio_seconds}", '-ac', '2', path],
+                       check=True)
+        files.append(path)
+    _, _, stdout, stderr = run_tool(environment, 'openai_transcribe', ['--jobs', str(args.concurrency)] + files,
+                                    metrics_file)
+    # Transcripts are printed as they arrive, so there is no latency per file to report
+    return {"operations": len(files), "failed": stderr.count('Error while'), "latency": latency_summary([])}
+
+SCENARIO_FUNCTIONS = {
+    'chat': chat_scenario,
+    'stream': stream_scenario,
+    'models': models_scenario,
+    'batch': batch_scenario,
+    'client': client_scenario,
+    'transcribe': transcribe_scenario,
+}
+
+def run_scenario(environment, name, args):
+    """Runs one scenario and returns its results, or None if it cannot run here."""
+    metrics_file = environment.path(f"{name}-metrics.jsonl")
+    environment.reset_stats()
+    start = time.perf_counter()
+    results = SCENARIO_FUNCTIONS[name](environment, args, metrics_file)
+    wall = time.perf_counter() - start
+    if results is None:
+        return None
+    counters = read_counters(metrics_file)
+    server = environment.stats()
+    results.update({
+        "scenario": name,
+        "wall_seconds": wall,
+        "operations_per_second": results["operations"] / wall,
+        "api_requests": counters.get('api_requests'),
+        "retries": counters.get('retries', 0),
+        "server_requests": sum(server["requests"].values()),
+        "injected_errors": sum(server["injected_errors"].values()),
+    })
+    return results
+
+def format_seconds(value):
+    return f"{value * 1000:8.0f}" if value is not None else f"{'-':>8}"
+
+def print_results(results):
+    """Prints one line of results per scenario."""
+    print(f"{'scenario':<11}{'ops':>6}{'failed':>7}{'wall s':>8}{'ops/s':>8}"
+          + ''.join(f"{'p' + str(p) + ' ms':>9}" for p in PERCENTILES) + f"{'max ms':>9}"
+          + f"{'retries':>8}{'server':>8}{'errors':>8}")
+    for result in results:
+        latency = result["latency"]
+        print(f"{result['scenario']:<11}{result['operations']:>6}{result['failed']:>7}{result['wall_seconds']:>8.2f}"
+              f"{result['operations_per_second']:>8.1f}"
+              + ''.join(f" {format_seconds(latency['p' + str(p)])}" for p in PERCENTILES)
+              + f" {format_seconds(latency['max'])}"
+              + f"{result['retries']:>8}{result['server_requests']:>8}{result['injected_errors']:>8}")
+        if "time_to_first_token" in result:
+            first_token = result["time_to_first_token"]
+            print(f"{'  first token':<40}"
+                  + ''.join(f" {format_seconds(first_token['p' + str(p)])}" for p in PERCENTILES)
+                  + f" {format_seconds(first_token['max'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive the tools against the mock OpenAI server and report throughput and latency.',
+                                     epilog='Any other options are passed to benchmarks/mock_openai_server.py.')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='run this scenario (default: all)')
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS,
+                        help='operations per scenario (default: {})'.format(DEFAULT_REQUESTS))
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='operations in flight at once (default: {})'.format(DEFAULT_CONCURRENCY))
+    parser.add_argument('--files', type=int, default=DEFAULT_FILES,
+                        help='recordings for the transcribe scenario (default: {})'.format(DEFAULT_FILES))
+    parser.add_argument('--audio-seconds', type=float, default=DEFAULT_AUDIO_SECONDS,
+                        help='length of each recording (default: {})'.format(DEFAULT_AUDIO_SECONDS))
+    parser.add_argument('--base-url', type=str, help='use the mock server already running at this URL')
+    parser.add_argument('--output', type=str, help='write the results to this file as JSON')
+    args, server_args = parser.parse_known_args()
+    if args.requests < 1 or args.concurrency < 1 or args.files < 1:
+        parser.error('--requests, --concurrency and --files should be positive')
+
+    environment = Environment(server_args, args.base_url)
+    try:
+        results = []
+        for name in args.scenario or SCENARIOS:
+            result = run_scenario(environment, name, args)
+            if result is None:
+                print(f"Skipping the {name} scenario: ffmpeg is not installed", file=sys.stderr)
+            else:
+                results.append(result)
+    finally:
+        environment.close()
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({"server_options": server_args, "requests": args.requests, "concurrency": args.concurrency,
+                       "results": results}, output, indent=4)
+
+if __name__ == '__main__':
+    main()
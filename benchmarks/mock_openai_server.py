@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+NAME
+    mock_openai_server - a local stand-in for the OpenAI API endpoints the tools use
+
+SYNOPSIS
+    python benchmarks/mock_openai_server.py [options]
+
+DESCRIPTION
+    mock_openai_server answers the chat completions (streamed or not),
+    models and audio transcriptions endpoints of the OpenAI API under
+    /v1, so that openai-chat, openai-transcribe and AsyncClient can be
+    benchmarked and tested without network access or an API key. Any
+    bearer token is accepted; a request without one gets a 401 error.
+
+    Replies are made up of filler words. How long each request takes,
+    how long each reply is and how often requests fail are drawn from
+    the distributions given below, so runs can imitate a fast or a
+    slow, a healthy or a struggling service. With --seed, the draws
+    repeat from run to run, apart from the order in which concurrent
+    requests take them.
+
+    GET /_stats returns the number of requests received for each
+    endpoint, the number answered with each status, the errors
+    injected and the bytes received, as JSON. POST /_stats/reset sets
+    them back to zero.
+
+    Once it is listening, the server prints its base URL, for example
+    http://127.0.0.1:8080/v1, on a line of its own on standard output.
+
+DISTRIBUTIONS
+    Latencies and reply sizes are given as a number, for a constant, or
+    as one of:
+
+    uniform:LOW,HIGH
+    normal:MEAN,STDDEV
+    lognormal:MEDIAN,SIGMA
+    exponential:MEAN
+
+    Draws below zero count as zero.
+
+OPTIONS
+    --host HOST
+        Address to listen on. Defaults to 127.0.0.1.
+
+    --port PORT
+        Port to listen on. 0, the default, picks a free port.
+
+    --latency DIST
+        Seconds before the first byte of every response. Defaults to
+        lognormal:0.2,0.5.
+
+    --token-latency DIST
+        Seconds to generate each word of a chat reply: the delay
+        between streamed chunks, and part of the time before a reply
+        that is not streamed. Defaults to 0.01.
+
+    --audio-latency DIST
+        Seconds to transcribe each megabyte of uploaded audio, on top of
+        --latency. Defaults to 1.
+
+    --reply-words DIST
+        Words in each chat reply. Defaults to lognormal:100,0.7.
+
+    --transcript-words-per-mb N
+        Words in a transcript for each megabyte of uploaded audio.
+        Defaults to 2000.
+
+    --rate-limit-rate P
+        Fraction of API requests answered with a 429 rate limit error.
+        Defaults to 0.
+
+    --server-error-rate P
+        Fraction of API requests answered with a 500, 502 or 503 error.
+        Defaults to 0.
+
+    --retry-after SECONDS
+        Send a Retry-After header with every 429 error.
+
+    --seed N
+        Seed the random draws.
+
+    --quiet
+        Do not log each request to standard error.
+
+EXAMPLES
+    Imitate a slow, flaky service:
+    python benchmarks/mock_openai_server.py --port 8080 --latency lognormal:1,0.8 --rate-limit-rate 0.1 --server-error-rate 0.02
+
+    Then point a project at it in ~/.openai.conf:
+    [mock]
+    api_key = sk-mock
+    api_base = http://127.0.0.1:8080/v1
+
+DATE
+    2026-10-17
+"""
+
+import argparse
+import collections
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Define constants
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_LATENCY = 'lognormal:0.2,0.5'
+DEFAULT_TOKEN_LATENCY = '0.01'
+DEFAULT_AUDIO_LATENCY = '1'
+DEFAULT_REPLY_WORDS = 'lognormal:100,0.7'
+DEFAULT_TRANSCRIPT_WORDS_PER_MB = 2000
+MODELS = ['gpt-3.5-turbo', 'gpt-3.5-turbo-0613', 'gpt-3.5-turbo-16k', 'gpt-4', 'gpt-4-0613', 'gpt-4-32k', 'whisper-1']
+WORDS = ('the quick brown fox jumps over a lazy dog while seven wizards quietly '
+         'judge boxing matches and vexed zebras hum along').split()
+SERVER_ERRORS = [(500, 'The server had an error while processing your request.'),
+                 (502, 'Bad gateway.'),
+                 (503, 'The server is overloaded or not ready yet.')]
+
+def parse_distribution(text):
+    """Returns a function that draws a nonnegative number from the distribution described by text, given a random.Random."""
+    name, _, parameters = text.partition(':')
+    if not parameters:
+        value = float(name)
+        return lambda rng: value
+    values = [float(value) for value in parameters.split(',')]
+    draws = {
+        'uniform': lambda rng: rng.uniform(values[0], values[1]),
+        'normal': lambda rng: rng.gauss(values[0], values[1]),
+        'lognormal': lambda rng: rng.lognormvariate(math.log(values[0]), values[1]),
+        'exponential': lambda rng: rng.expovariate(1 / values[0]),
+    }
+    if name not in draws or len(values) != (1 if name == 'exponential' else 2):
+        raise ValueError(f"unknown distribution '{text}'")
+    draw = draws[name]
+    return lambda rng: max(draw(rng), 0.0)
+
+def distribution(text):
+    """argparse type for a distribution."""
+    try:
+        parse_distribution(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return text
+
+class MockState:
+    """The settings, random draws and statistics shared by every request handler."""
+
+    def __init__(self, args):
+        self.args = args
+        self.latency = parse_distribution(args.latency)
+        self.token_latency = parse_distribution(args.token_latency)
+        self.audio_latency = parse_distribution(args.audio_latency)
+        self.reply_words = parse_distribution(args.reply_words)
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = collections.Counter()
+            self.statuses = collections.Counter()
+            self.injected = collections.Counter()
+            self.bytes_received = 0
+
+    def draw(self, function):
+        with self.lock:
+            return function(self.rng)
+
+    def random(self):
+        with self.lock:
+            return self.rng.random()
+
+    def words(self, count):
+        with self.lock:
+            return [self.rng.choice(WORDS) for _ in range(count)]
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(self.requests), "statuses": {str(k): v for k, v in self.statuses.items()},
+                    "injected_errors": {str(k): v for k, v in self.injected.items()},
+                    "bytes_received": self.bytes_received}
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Answers one connection's requests like the OpenAI API would."""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'mock-openai/1.0'
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if not self.state.args.quiet:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        with self.state.lock:
+            self.state.statuses[status] += 1
+
+    def send_error_json(self, status, message, error_type, headers=()):
+        self.send_json(status, {"error": {"message": message, "type": error_type, "param": None, "code": None}}, headers)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        with self.state.lock:
+            self.state.bytes_received += len(body)
+        return body
+
+    def endpoint(self):
+        path = self.path.split('?', 1)[0].rstrip('/')
+        return path[len('/v1'):] if path.startswith('/v1/') else path
+
+    def do_GET(self):
+        endpoint = self.endpoint()
+        if endpoint == '/_stats':
+            return self.send_json(200, self.state.stats())
+        self.handle_api(endpoint, b'')
+
+    def do_POST(self):
+        endpoint = self.endpoint()
+        body = self.read_body()
+        if endpoint == '/_stats/reset':
+            self.state.reset()
+            return self.send_json(200, {})
+        self.handle_api(endpoint, body)
+
+    def handle_api(self, endpoint, body):
+        handlers = {
+            ('GET', '/models'): self.models,
+            ('POST', '/chat/completions'): self.chat_completions,
+            ('POST', '/audio/transcriptions'): self.audio_transcriptions,
+        }
+        handler = handlers.get((self.command, endpoint))
+        if handler is None:
+            return self.send_error_json(404, f"Unknown request URL: {self.command} {self.path}.", 'invalid_request_error')
+        with self.state.lock:
+            self.state.requests[endpoint] += 1
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self.send_error_json(401, 'You did not provide an API key.', 'invalid_request_error')
+        if self.inject_error():
+            return
+        handler(body)
+
+    def inject_error(self):
+        """Answers the request with a rate limit or server error, at the configured rates, returning whether it did."""
+        args = self.state.args
+        draw = self.state.random()
+        if draw < args.rate_limit_rate:
+            time.sleep(self.state.draw(self.state.latency) / 10)  # rate limit errors come back quickly
+            headers = [('Retry-After', str(args.retry_after))] if args.retry_after is not None else []
+            with self.state.lock:
+                self.state.injected[429] += 1
+            self.send_error_json(429, 'Rate limit reached for requests.', 'requests', headers)
+            return True
+        if draw < args.rate_limit_rate + args.server_error_rate:
+            status, message = SERVER_ERRORS[int(self.state.random() * len(SERVER_ERRORS))]
+            time.sleep(self.state.draw(self.state.latency))
+            with self.state.lock:
+                self.state.injected[status] += 1
+            self.send_error_json(status, message, 'server_error')
+            return True
+        return False
+
+    def models(self, body):
+        time.sleep(self.state.draw(self.state.latency))
+        self.send_json(200, {"object": "list", "data": [
+            {"id": model, "object": "model", "created": 1686935002, "owned_by": "openai"} for model in MODELS]})
+
+    def chat_completions(self, body):
+        try:
+            request = json.loads(body)
+            model = request['model']
+            messages = request['messages']
+            if not isinstance(messages, list) or not all(isinstance(message, dict) for message in messages):
+                raise TypeError('messages is not a list of objects')
+            max_tokens = request.get('max_tokens')
+            if max_tokens is not None and not isinstance(max_tokens, int):
+                raise TypeError('max_tokens is not an integer')
+            prompt_tokens = sum(len(str(message.get('content') or '').split()) + 4 for message in messages) + 3
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return self.send_error_json(400, 'The request body is not a valid chat completion request.',
+                                        'invalid_request_error')
+        words = self.state.words(max(int(self.state.draw(self.state.reply_words)), 1))
+        if max_tokens:
+            words = words[:max_tokens]
+        completion_id = f"chatcmpl-mock{int(time.time() * 1000)}"
+        created = int(time.time())
+        time.sleep(self.state.draw(self.state.latency))
+        if request.get('stream'):
+            return self.stream_chat(completion_id, created, model, words)
+        for _ in words:
+            time.sleep(self.state.draw(self.state.token_latency))
+        self.send_json(200, {
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": ' '.join(words)},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                      "total_tokens": prompt_tokens + len(words)},
+        })
+
+    def stream_chat(self, completion_id, created, model, words):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        with self.state.lock:
+            self.state.statuses[200] += 1
+
+        def send_event(data):
+            event = f"data: {data}\n\n".encode('utf-8')
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(event), event))
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                               "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+
+        send_event(chunk({"role": "assistant"}))
+        for i, word in enumerate(words):
+            time.sleep(self.state.draw(self.state.token_latency))
+            send_event(chunk({"content": word if i == 0 else ' ' + word}))
+        send_event(chunk({}, 'stop'))
+        send_event('[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def audio_transcriptions(self, body):
+        if b'name="file"' not in body:
+            return self.send_error_json(400, "'file' is a required property", 'invalid_request_error')
+        megabytes = len(body) / 1e6
+        time.sleep(self.state.draw(self.state.latency) + self.state.draw(self.state.audio_latency) * megabytes)
+        words = self.state.words(max(int(self.state.args.transcript_words_per_mb * megabytes), 1))
+        self.send_json(200, {"text": ' '.join(words).capitalize() + '.'})
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the OpenAI API endpoints the tools use.')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='address to listen on (default: {})'.format(DEFAULT_HOST))
+    parser.add_argument('--port', type=int, default=0, help='port to listen on, or 0 to pick a free one')
+    parser.add_argument('--latency', type=distribution, default=DEFAULT_LATENCY,
+                        help='seconds before the first byte of every response (default: {})'.format(DEFAULT_LATENCY))
+    parser.add_argument('--token-latency', type=distribution, default=DEFAULT_TOKEN_LATENCY,
+                        help='seconds to generate each word of a chat reply (default: {})'.format(DEFAULT_TOKEN_LATENCY))
+    parser.add_argument('--audio-latency', type=distribution, default=DEFAULT_AUDIO_LATENCY,
+                        help='seconds to transcribe each megabyte of audio (default: {})'.format(DEFAULT_AUDIO_LATENCY))
+    parser.add_argument('--reply-words', type=distribution, default=DEFAULT_REPLY_WORDS,
+                        help='words in each chat reply (default: {})'.format(DEFAULT_REPLY_WORDS))
+    parser.add_argument('--transcript-words-per-mb', type=int, default=DEFAULT_TRANSCRIPT_WORDS_PER_MB,
+                        help='words in a transcript per megabyte of audio (default: {})'.format(DEFAULT_TRANSCRIPT_WORDS_PER_MB))
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction of requests to fail with 429')
+    parser.add_argument('--server-error-rate', type=float, default=0.0, help='fraction of requests to fail with 500, 502 or 503')
+    parser.add_argument('--retry-after', type=float, metavar='SECONDS', help='send a Retry-After header with 429 errors')
+    parser.add_argument('--seed', type=int, help='seed the random draws')
+    parser.add_argument('--quiet', action='store_true', help='do not log each request')
+    args = parser.parse_args(argv)
+    if not 0 <= args.rate_limit_rate + args.server_error_rate <= 1:
+        parser.error('the error rates should be between 0 and 1 and add up to at most 1')
+    return args
+
+def make_server(args):
+    """Returns a ThreadingHTTPServer for args, already bound to its port."""
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(args)
+    return server
+
+def main():
+    args = parse_args()
+    server = make_server(args)
+    host, port = server.server_address[:2]
+    print(f"http://{host}:{port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+NAME
+    startup_time - check the cold-start import time of every console script
+
+SYNOPSIS
+    python benchmarks/startup_time.py [options]
+
+DESCRIPTION
+    startup_time runs each console script listed in setup.py with
+    --help under `python -X importtime`, and adds up the time spent
+    importing modules, leaving out those the interpreter imports at
+    startup anyway. It fails if any script goes over its budget, or
+    if --help imports one of the heavy dependencies (tiktoken, openai,
+    pydub, moviepy, aiohttp, requests) that should only be loaded on
+    the code path that needs them.
+
+    Each script is run --repeat times and the fastest run is reported,
+    to keep the check stable on a busy machine.
+
+OPTIONS
+    --budget MS
+        Maximum import time in milliseconds allowed for each script.
+        Defaults to 50.
+
+    --repeat N
+        Run each script N times. Defaults to 5.
+
+    --verbose
+        Print the slowest imports of each script.
+
+EXAMPLES
+    Check every console script against the default budget:
+    python benchmarks/startup_time.py
+
+DATE
+    2026-10-17
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Define constants
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = 50
+DEFAULT_REPEAT = 5
+HEAVY_MODULES = ['tiktoken', 'openai', 'pydub', 'moviepy', 'aiohttp', 'requests']
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def console_scripts():
+    """Returns (name, module) for each console script in setup.py."""
+    with open(os.path.join(ROOT, 'setup.py')) as file:
+        return re.findall(r'"([\w-]+) = ([\w.]+):main"', file.read())
+
+def import_times(*arguments):
+    """Runs python -X importtime with arguments and returns [(cumulative microseconds, module name, indent)] for each import."""
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + list(arguments), cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            times.append((int(match.group(2)), match.group(4), len(match.group(3))))
+    return times
+
+def script_import_times(module, interpreter_modules):
+    """Returns ([(cumulative microseconds, module name)] for the script's own top-level imports, [every module imported])."""
+    times = import_times('-m', module, '--help')
+    # The least indented imports are the ones made directly by the script
+    # or the interpreter; leave out those the interpreter makes anyway
+    top = min((indent for _, _, indent in times), default=0)
+    top_level = [(cumulative, name) for cumulative, name, indent in times
+                 if indent == top and name not in interpreter_modules]
+    return top_level, [name for _, name, _ in times]
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the cold-start import time of every console script.')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_MS,
+                        help='maximum import time in milliseconds (default: {})'.format(DEFAULT_BUDGET_MS))
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='run each script this many times (default: {})'.format(DEFAULT_REPEAT))
+    parser.add_argument('--verbose', action='store_true', help='print the slowest imports of each script')
+    args = parser.parse_args()
+
+    interpreter_modules = {name for _, name, _ in import_times('-c', 'pass')}
+    failures = 0
+    for name, module in console_scripts():
+        best = None
+        for _ in range(args.repeat):
+            top_level, all_modules = script_import_times(module, interpreter_modules)
+            total_ms = sum(cumulative for cumulative, _ in top_level) / 1000
+            if best is None or total_ms < best[0]:
+                best = (total_ms, top_level, all_modules)
+        total_ms, top_level, all_modules = best
+        heavy = sorted({module_name.split('.')[0] for module_name in all_modules} & set(HEAVY_MODULES))
+        ok = total_ms <= args.budget and not heavy
+        failures += not ok
+        status = 'ok' if ok else 'FAIL'
+        print(f"{status:<4} {name:<22} {total_ms:7.1f} ms" + (f"  imports {', '.join(heavy)}" if heavy else ''))
+        if args.verbose:
+            for cumulative, module_name in sorted(top_level, reverse=True)[:5]:
+                print(f"       {cumulative / 1000:7.1f} ms  {module_name}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,2 @@
-from .openai_tokens import count_tokens_in_file, count_tokens_in_text, num_tokens_from_messages, head_tokens_text
+from .openai_client import AsyncClient
+from .openai_tokens import TokenCounter, get_token_counter, context_limit, count_tokens_in_file, count_tokens_in_files, count_tokens_in_text, num_tokens_from_messages, head_tokens_text, head_tokens_in_file, split_tokens_in_file
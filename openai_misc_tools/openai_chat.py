@@ -63,6 +63,84 @@ OPTIONS
     --list-models
         List all models owned by OpenAI that start with "gpt-".
 
+    --stream
+        Print the response as it is generated, instead of waiting for
+        all of it. The time to the first token and the total time are
+        written to standard error.
+
+    --interactive
+        After answering any messages given on the command line, read
+        further user messages from standard input, one per line, and
+        answer each in the same conversation until end of file. The
+        HTTP connection is kept open between turns. The token count of
+        each message is worked out once, and when the conversation
+        nears the model's context limit the oldest turns are dropped,
+        keeping system messages.
+
+    --context-limit N
+        With --interactive, the context window to fit the conversation
+        in. Default is the model's own limit.
+
+    --reply-tokens N
+        With --interactive, the number of tokens to leave free in the
+        context window for each reply. Default is 1024.
+
+    --batch FILE
+        Read chat requests from the JSON lines FILE, or from standard
+        input if FILE is '-', and send them concurrently. Each record
+        holds a "messages" list and may override the model and sampling
+        options or add other API parameters such as "max_tokens". An
+        "id" field is copied to the output unchanged. Messages given
+        with --system, --user and --assistant are put before the
+        messages of every record. One JSON line is written for each
+        record, in input order, holding its "line" number, "id",
+        "content" and "usage", or an "error" if it failed. Summary
+        statistics are written to standard error.
+
+    --jobs N
+        With --batch, the number of requests to have in flight at
+        once. Default is 8.
+
+    --max-retries N
+        Retry requests that fail with a rate limit (429) or server
+        (5xx) error, a timeout or a dropped connection up to N times,
+        waiting longer after each failure. Default is 5.
+
+    --cache
+        Reuse earlier responses to identical requests from an on-disk
+        cache, and add new responses to it. A request is identical if
+        its model, messages and sampling options are all the same, so
+        this is most useful with --temperature 0.
+
+    --no-cache
+        Do not use the cache, even if the project configuration
+        enables it.
+
+    --refresh
+        Send every request and replace its cached response.
+
+    --cache-file CACHE_FILE
+        Path to the cache database. Default is
+        $XDG_CACHE_HOME/openai-misc-tools/chat-responses.sqlite, or
+        ~/.cache/openai-misc-tools/chat-responses.sqlite.
+
+    --cache-ttl SECONDS
+        Ignore and evict cached responses older than SECONDS. Default
+        is to keep them until they are evicted for space.
+
+    --cache-max-entries N
+        The number of responses to keep in the cache, evicting the
+        least recently used. Default is 10000.
+
+    --metrics FILE
+        Record the wall and CPU time of each stage of the run (reading
+        the configuration, importing openai, the cache, counting
+        tokens, waiting for the rate limit and the API requests), the
+        requests made, bytes uploaded, tokens used, retries and peak
+        memory use, and append them to FILE as one JSON line. If FILE
+        ends in .prom, write them to it as a Prometheus textfile
+        instead.
+
     --debug
         Provide detailed information about the interaction.
 
@@ -79,10 +157,26 @@ CONFIGURATION
     file. However, the --config option will override both the default
     and the environment variable.
 
+    A project section may also set 'api_base' to send requests to a
+    different API endpoint, such as a local stand-in server for
+    testing. The OPENAI_API_BASE environment variable does the same for
+    every project. Setting 'cache = true' in a project section turns on
+    the response cache for that project as if --cache were given, and
+    'cache_ttl' sets its default --cache-ttl.
+
+    A project section may set 'requests_per_minute' and
+    'tokens_per_minute' to keep every openai-chat and
+    openai-transcribe process on the host that uses its API key under
+    those limits, for each model. Requests wait locally for their turn
+    instead of failing with rate limit errors. The prompt tokens of
+    each request are counted before it is sent.
+
     Example configuration file:
     [MyProject]
     org_id = org-OPENAI_OR_GID
     api_key = sk-OPENAI_API_KEY
+    requests_per_minute = 200
+    tokens_per_minute = 40000
 
 EXAMPLES
     To run the program with default settings:
@@ -116,19 +210,47 @@ EXAMPLES
     To list all available models:
 
     $ openai-chat --list-models
+
+    To print a long answer as it is generated:
+
+    $ openai-chat --stream --user "Write a short story about the sky."
+
+    To hold a conversation, with a system prompt:
+
+    $ openai-chat --interactive --system "You are a terse assistant."
+
+    To answer repeated identical requests from the cache:
+
+    $ openai-chat --cache --temperature 0 --user "Why is the sky blue?"
+
+    To answer a file of requests, 16 at a time:
+
+    $ openai-chat --batch requests.jsonl --jobs 16 > responses.jsonl
 """
 
 # Import necessary libraries
 import argparse
+import collections
 import configparser
+import functools
 import os
 import sys
 import signal
-import openai
 import json
+import time
+from . import openai_chat_cache
+from . import openai_chat_session
+from . import openai_metrics
+from . import openai_rate_limit
+from . import openai_retry
+from . import openai_tokens
+
+# The openai package is slow to import, so it is imported only where it is used
 
 # Define constants
 DEFAULT_CONFIG_FILE = '~/.openai.conf'
+DEFAULT_BATCH_JOBS = 8
+BATCH_WINDOW_FACTOR = 4  # records read ahead per request in flight, so one slow request doesn't stall the rest
 
 # Define signal handling function
 def signal_handler(signal, frame):
@@ -178,6 +300,20 @@ def create_argument_parser():
     parser.add_argument('--frequency-penalty', type=float, default=None, help='Frequency penalty for the GPT model. A higher value reduces the chance of frequent tokens appearing.')
     parser.add_argument('--presence-penalty', type=float, default=None, help='Presence penalty for the GPT model. A higher value reduces the chance of new tokens appearing.')
     parser.add_argument('--list-models', action='store_true', help='List all models owned by OpenAI that start with "gpt-".')
+    parser.add_argument('--stream', action='store_true', help='Print the response as it is generated, and report the time to the first token.')
+    parser.add_argument('--interactive', action='store_true', help='Read further user messages from standard input and answer each in the same conversation.')
+    parser.add_argument('--context-limit', type=int, help="With --interactive, the context window to fit the conversation in (default: the model's).")
+    parser.add_argument('--reply-tokens', type=int, default=openai_chat_session.DEFAULT_REPLY_TOKENS, help='With --interactive, the tokens to leave free for each reply.')
+    parser.add_argument('--batch', type=str, metavar='FILE', help="Send the chat requests in a JSON lines file, or '-' for standard input, concurrently.")
+    parser.add_argument('--jobs', type=int, default=DEFAULT_BATCH_JOBS, help='With --batch, the number of requests to have in flight at once.')
+    parser.add_argument('--max-retries', type=int, default=openai_retry.DEFAULT_MAX_RETRIES, help='Retry rate limit and server errors up to this many times.')
+    parser.add_argument('--cache', action='store_true', help='Reuse responses to identical requests from an on-disk cache.')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the cache, even if the project configuration enables it.')
+    parser.add_argument('--refresh', '--cache-refresh', action='store_true', help='Send every request and replace its cached response.')
+    parser.add_argument('--cache-file', type=str, help='Path to the cache database (default: {}).'.format(openai_chat_cache.default_cache_path(openai_chat_cache.DEFAULT_CACHE_NAME)))
+    parser.add_argument('--cache-ttl', type=float, metavar='SECONDS', help='Ignore and evict cached responses older than this.')
+    parser.add_argument('--cache-max-entries', type=int, default=openai_chat_cache.DEFAULT_MAX_ENTRIES, help='The number of responses to keep in the cache.')
+    parser.add_argument('--metrics', type=str, metavar='FILE', help='Append timing and usage metrics to FILE as JSON lines, or write a Prometheus textfile if FILE ends in .prom.')
     parser.add_argument('--debug', action='store_true', help='Provide detailed information about the interaction.')
     return parser
 
@@ -188,12 +324,19 @@ def read_configuration(config_file, project):
     config.read(os.path.expanduser(config_file))
     return config[project]
 
-# Function to use OpenAI API
-def use_openai_api(api_key, model, messages, temperature, top_p, frequency_penalty, presence_penalty, debug):
-    """Use the OpenAI API to generate a chat-based response."""
+# Function to configure the OpenAI API client
+def configure_openai(api_key, api_base=None):
+    """Import the openai package and set the API key, and the API base if given."""
+    with openai_metrics.stage('import_openai'):
+        import openai
     openai.api_key = api_key
-    
-    # Construct API parameters dictionary
+    if api_base:
+        openai.api_base = api_base
+    return openai
+
+# Function to build API parameters
+def build_api_params(model, messages, temperature, top_p, frequency_penalty, presence_penalty):
+    """Return the API parameters for a chat completion request, leaving out unset options."""
     api_params = {
         'model': model,
         'messages': messages,
@@ -204,21 +347,267 @@ def use_openai_api(api_key, model, messages, temperature, top_p, frequency_penal
     }
 
     # Remove None values using dictionary comprehension
-    api_params = {k: v for k, v in api_params.items() if v is not None}
+    return {k: v for k, v in api_params.items() if v is not None}
+
+# Function to open the response cache
+def open_response_cache(args, project_config):
+    """Return a ResponseCache if the options or the project configuration enable it, otherwise None."""
+    enabled = args.cache or args.cache_file or args.refresh or project_config.getboolean('cache', fallback=False)
+    if args.no_cache or not enabled:
+        return None
+    ttl = args.cache_ttl if args.cache_ttl is not None else project_config.getfloat('cache_ttl', fallback=None)
+    return openai_chat_cache.ResponseCache(args.cache_file, args.cache_max_entries, ttl, args.refresh)
+
+# Function to use OpenAI API
+def use_openai_api(api_key, model, messages, temperature, top_p, frequency_penalty, presence_penalty, debug,
+                   api_base=None, max_retries=openai_retry.DEFAULT_MAX_RETRIES, stream=False, limiter=None):
+    """Use the OpenAI API to generate a chat-based response, or an iterator of response chunks if stream is true.
+
+    If limiter is a RateLimiter, each attempt waits for its turn under the shared rate limits.
+    """
+    openai = configure_openai(api_key, api_base)
+    api_params = build_api_params(model, messages, temperature, top_p, frequency_penalty, presence_penalty)
+    if stream:
+        api_params['stream'] = True
 
     # Print the request if debug mode is enabled
     if debug:
         print("Sending the following request to the OpenAI API:")
         print(json.dumps(api_params, indent=4))
 
-    response = openai.ChatCompletion.create(**api_params)
+    tokens = 0
+    if limiter is not None and limiter.tokens_per_minute:
+        with openai_metrics.stage('tokenize'):
+            tokens = openai_rate_limit.estimate_tokens(api_params)
+
+    def create(**api_params):
+        if limiter is not None:
+            wait = limiter.acquire(tokens)
+            if wait and debug:
+                print(f"Waited {wait:.1f}s for the rate limit", file=sys.stderr)
+        record_request(api_params)
+        return openai.ChatCompletion.create(**api_params)
+
+    with openai_metrics.stage('api'):
+        response = openai_retry.call_with_retries(create, max_retries=max_retries, **api_params)
+    if not stream:
+        openai_metrics.add_usage(response)
+        if limiter is not None and limiter.tokens_per_minute:
+            limiter.charge(response['usage']['total_tokens'] - tokens)
+    return response
+
+# Function to record a request in the metrics
+def record_request(api_params):
+    """Count a request, and the bytes of its body, in the metrics."""
+    openai_metrics.add('api_requests')
+    if openai_metrics.enabled():
+        openai_metrics.add('bytes_uploaded', len(json.dumps(api_params).encode('utf-8')))
+
+# Function to print a streamed response
+def print_streamed_response(chunks, start, output=sys.stdout):
+    """Print each content delta from chunks as it arrives, and return the full response reassembled from them.
+
+    The time to the first token and the total time, counted from start,
+    are written to standard error.
+    """
+    response = None
+    first_token_time = None
+    for chunk in chunks:
+        if response is None:
+            response = {k: chunk[k] for k in ('id', 'created', 'model') if k in chunk}
+            response['object'] = 'chat.completion'
+            response['choices'] = []
+        for choice in chunk['choices']:
+            while len(response['choices']) <= choice['index']:
+                response['choices'].append({'index': len(response['choices']),
+                                            'message': {'role': 'assistant', 'content': ''},
+                                            'finish_reason': None})
+            message = response['choices'][choice['index']]['message']
+            delta = choice.get('delta', {})
+            if 'role' in delta:
+                message['role'] = delta['role']
+            content = delta.get('content')
+            if content:
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                message['content'] += content
+                if choice['index'] == 0:
+                    output.write(content)
+                    output.flush()
+            if choice.get('finish_reason'):
+                response['choices'][choice['index']]['finish_reason'] = choice['finish_reason']
+    output.write('\n')
+    output.flush()
+
+    end = time.perf_counter()
+    if first_token_time is not None:
+        print(f"time to first token: {first_token_time - start:.3f}s", file=sys.stderr)
+    print(f"total time: {end - start:.3f}s", file=sys.stderr)
     return response
 
+# Function to hold an interactive conversation
+def run_interactive(api_key, api_base, args, conversation, limiter=None):
+    """Answer user messages read from standard input one line at a time, all in the same conversation."""
+    interactive = sys.stdin.isatty()
+    if interactive:
+        try:
+            import readline  # gives input() line editing and history
+        except ImportError:
+            pass
+
+    # Answer the messages from the command line first, if they end with a user message
+    answer = bool(conversation.messages) and conversation.messages[-1]['role'] == 'user'
+    while True:
+        if not answer:
+            try:
+                line = input('> ' if interactive else '')
+            except EOFError:
+                break
+            if not line.strip():
+                continue
+            with openai_metrics.stage('tokenize'):
+                conversation.append({"role": "user", "content": line})
+        answer = False
+
+        with openai_metrics.stage('tokenize'):
+            dropped = conversation.trim()
+        if dropped and args.debug:
+            print(f"Dropped the oldest {dropped} messages to fit the context window.", file=sys.stderr)
+
+        start = time.perf_counter()
+        try:
+            response = use_openai_api(api_key, args.model, conversation.messages, args.temperature, args.top_p_sampling, args.frequency_penalty, args.presence_penalty, args.debug,
+                                      api_base, args.max_retries, args.stream, limiter)
+            if args.stream:
+                response = print_streamed_response(response, start)
+        except Exception as e:
+            # Forget the unanswered message, so it can be sent again
+            print(f"Error: {e}", file=sys.stderr)
+            conversation.pop()
+            continue
+
+        content = response['choices'][0]['message']['content']
+        if args.debug:
+            print(json.dumps(response, indent=4))
+        elif not args.stream:
+            print(content)
+        with openai_metrics.stage('tokenize'):
+            conversation.append({"role": "assistant", "content": content})
+        if args.debug:
+            print(f"Conversation: {len(conversation.messages)} messages, {conversation.total} of {conversation.limit} tokens", file=sys.stderr)
+
+# Function to answer one batch request
+async def complete_batch_record(openai, semaphore, line_number, record, api_params, messages, max_retries, stats, debug, cache=None, limiter_for=None):
+    """Send one batch request record and return its output record."""
+    result = {"line": line_number}
+    if "id" in record:
+        result["id"] = record["id"]
+
+    # Settings in the record override those from the command line
+    params = dict(api_params)
+    params.update({k: v for k, v in record.items() if k not in ("id", "messages")})
+    params["messages"] = messages + record["messages"]
+
+    if cache is not None:
+        with openai_metrics.stage('cache'):
+            response = cache.lookup(params)
+        if response is not None:
+            stats["cached"] += 1
+            openai_metrics.add('cache_hits')
+            return batch_result(result, response, debug)
+
+    def count_retry(error, attempt, delay):
+        stats["retries"] += 1
+        if debug:
+            print(f"Retrying line {line_number} in {delay:.1f}s after: {error}", file=sys.stderr)
+
+    limiter = None
+    tokens = 0
+
+    async def acreate(**params):
+        if limiter is not None:
+            await limiter.aacquire(tokens)
+        record_request(params)
+        return await openai.ChatCompletion.acreate(**params)
+
+    async with semaphore:
+        try:
+            # A record the limiter cannot size fails on its own, like any other bad record
+            limiter = limiter_for(params["model"]) if limiter_for is not None else None
+            if limiter is not None and limiter.tokens_per_minute:
+                with openai_metrics.stage('tokenize'):
+                    tokens = openai_rate_limit.estimate_tokens(params)
+            with openai_metrics.stage('api'):
+                response = await openai_retry.acall_with_retries(acreate, max_retries=max_retries,
+                                                                 on_retry=count_retry, **params)
+        except Exception as e:
+            stats["failed"] += 1
+            result["error"] = f"{type(e).__name__}: {e}"
+            return result
+    openai_metrics.add_usage(response)
+    if limiter is not None and limiter.tokens_per_minute:
+        limiter.charge(response["usage"]["total_tokens"] - tokens)
+    if cache is not None:
+        with openai_metrics.stage('cache'):
+            cache.store(params, response)
+    return batch_result(result, response, debug)
+
+def batch_result(result, response, debug):
+    """Add the content and usage of response to the batch output record result, and return it."""
+    result["content"] = response["choices"][0]["message"]["content"]
+    result["usage"] = response.get("usage")
+    if debug:
+        result["response"] = response
+    return result
+
+# Function to answer a file of batch requests
+async def run_batch(file, api_key, api_base, api_params, messages, jobs, max_retries, debug, cache=None, limiter_for=None):
+    """Send the chat requests in a JSON lines file with at most jobs in flight, printing results in input order.
+
+    Returns the number of requests that failed.
+    """
+    import asyncio
+    import aiohttp
+    openai = configure_openai(api_key, api_base)
+    stats = {"requests": 0, "cached": 0, "failed": 0, "retries": 0}
+    start = time.perf_counter()
+
+    # Share one pool of keep-alive connections between all requests
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=jobs)) as session:
+        openai.aiosession.set(session)
+        semaphore = asyncio.Semaphore(jobs)
+        pending = collections.deque()
+        for line_number, record in openai_tokens.read_jsonl_records(file):
+            pending.append(asyncio.ensure_future(complete_batch_record(
+                openai, semaphore, line_number, record, api_params, messages, max_retries, stats, debug, cache, limiter_for)))
+            stats["requests"] += 1
+            while len(pending) >= jobs * BATCH_WINDOW_FACTOR or (pending and pending[0].done()):
+                print(json.dumps(await pending.popleft()), flush=True)
+        while pending:
+            print(json.dumps(await pending.popleft()), flush=True)
+
+    seconds = time.perf_counter() - start
+    print(f"requests: {stats['requests']}", file=sys.stderr)
+    if cache is not None:
+        print(f"cached: {stats['cached']}", file=sys.stderr)
+    print(f"failed: {stats['failed']}", file=sys.stderr)
+    print(f"retries: {stats['retries']}", file=sys.stderr)
+    print(f"seconds: {seconds:.3f}", file=sys.stderr)
+    if seconds > 0:
+        print(f"requests/s: {stats['requests'] / seconds:.2f}", file=sys.stderr)
+    return stats["failed"]
+
 # Function to list models
-def list_models(api_key):
+def list_models(api_key, api_base=None, max_retries=openai_retry.DEFAULT_MAX_RETRIES):
     """Lists all models owned by OpenAI that start with 'gpt-'."""
-    openai.api_key = api_key
-    models = openai.Model.list()
+    openai = configure_openai(api_key, api_base)
+
+    def list_all():
+        openai_metrics.add('api_requests')
+        return openai.Model.list()
+
+    with openai_metrics.stage('api'):
+        models = openai_retry.call_with_retries(list_all, max_retries=max_retries)
     gpt_models = [model.id for model in models.data if model.owned_by == 'openai' and model.id.startswith('gpt-')]
     for model in gpt_models:
         print(model)
@@ -234,27 +623,111 @@ def main():
     parser = create_argument_parser()
     args = parser.parse_args()
 
+    # Record metrics until the end of the run, however it ends
+    if args.metrics:
+        openai_metrics.enable('openai-chat')
+        try:
+            run(parser, args)
+        finally:
+            openai_metrics.write(args.metrics)
+    else:
+        run(parser, args)
+
+# Function to run the program
+def run(parser, args):
+    """Answer the request, or requests, given by the parsed command-line arguments."""
     # Load configuration
-    config_file = args.config if args.config else os.getenv('OPENAI_CONFIG', DEFAULT_CONFIG_FILE)
-    project_config = read_configuration(config_file, args.project)
+    with openai_metrics.stage('config'):
+        config_file = args.config if args.config else os.getenv('OPENAI_CONFIG', DEFAULT_CONFIG_FILE)
+        project_config = read_configuration(config_file, args.project)
+
+    if args.jobs < 1:
+        parser.error('the number of jobs should be positive')
+    if args.max_retries < 0:
+        parser.error('the number of retries should be nonnegative')
+    if args.cache_max_entries < 1:
+        parser.error('the number of cache entries should be positive')
 
     # If --list-models option was used
     if args.list_models:
-        list_models(project_config['api_key'])
+        list_models(project_config['api_key'], project_config.get('api_base'), args.max_retries)
+        return
+
+    # If --interactive option was used
+    if args.interactive:
+        if args.batch:
+            parser.error('--interactive cannot be used with --batch')
+        with openai_metrics.stage('tokenize'):
+            conversation = openai_chat_session.Conversation(args.model, args.context_limit, args.reply_tokens)
+            for message in getattr(args, 'messages', []):
+                conversation.append(message)
+        configure_openai(project_config['api_key'], project_config.get('api_base'))
+        run_interactive(project_config['api_key'], project_config.get('api_base'), args, conversation,
+                        openai_rate_limit.rate_limiter_from_config(project_config, args.model))
+        return
+
+    # If --batch option was used
+    if args.batch:
+        if args.stream:
+            parser.error('--stream cannot be used with --batch')
+        import asyncio
+        api_params = build_api_params(args.model, None, args.temperature, args.top_p_sampling, args.frequency_penalty, args.presence_penalty)
+        batch_file = sys.stdin if args.batch == '-' else open(args.batch, 'r')
+        cache = open_response_cache(args, project_config)
+        try:
+            with batch_file:
+                limiter_for = functools.lru_cache(maxsize=None)(lambda model: openai_rate_limit.rate_limiter_from_config(project_config, model))
+                failed = asyncio.run(run_batch(batch_file, project_config['api_key'], project_config.get('api_base'), api_params,
+                                               getattr(args, 'messages', []), args.jobs, args.max_retries, args.debug, cache, limiter_for))
+        finally:
+            if cache is not None:
+                cache.close()
+        if failed:
+            sys.exit(1)
         return
 
     # Check if at least one of the required arguments is provided
     if not args.messages:
         parser.error('At least one of --system, --system-file, --user, --user-file, --assistant, --assistant-file is required')
 
-    # Use OpenAI API
-    response = use_openai_api(project_config['api_key'], args.model, args.messages, args.temperature, args.top_p_sampling, args.frequency_penalty, args.presence_penalty, args.debug)
+    # Look for a cached response first, without importing openai
+    cache = open_response_cache(args, project_config)
+    response = None
+    if cache is not None:
+        api_params = build_api_params(args.model, args.messages, args.temperature, args.top_p_sampling, args.frequency_penalty, args.presence_penalty)
+        with openai_metrics.stage('cache'):
+            response = cache.lookup(api_params)
+        if response is not None:
+            openai_metrics.add('cache_hits')
+        if response is not None and args.debug:
+            print("Using the cached response to the following request:")
+            print(json.dumps(api_params, indent=4))
+
+    streamed = False
+    if response is None:
+        # Use OpenAI API, timing from after the slow openai import
+        configure_openai(project_config['api_key'], project_config.get('api_base'))
+        start = time.perf_counter()
+        response = use_openai_api(project_config['api_key'], args.model, args.messages, args.temperature, args.top_p_sampling, args.frequency_penalty, args.presence_penalty, args.debug,
+                                  project_config.get('api_base'), args.max_retries, args.stream,
+                                  openai_rate_limit.rate_limiter_from_config(project_config, args.model))
+
+        # Print the assistant's response as it arrives
+        if args.stream:
+            response = print_streamed_response(response, start)
+            streamed = True
+        if cache is not None:
+            with openai_metrics.stage('cache'):
+                cache.store(api_params, response)
+    if cache is not None:
+        with openai_metrics.stage('cache'):
+            cache.close()
 
     # Print the assistant's response
     if args.debug:
         print(json.dumps(response, indent=4))
-    else:
-        print(response.choices[0].message['content'])
+    elif not streamed:
+        print(response['choices'][0]['message']['content'])
 
 # Execute main function
 if __name__ == "__main__":
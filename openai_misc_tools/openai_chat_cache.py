@@ -0,0 +1,86 @@
+"""
+Persistent response cache for openai-chat.
+
+Responses are stored in an SQLite database keyed by a SHA-256 hash of
+the request's API parameters, serialized as canonical JSON, so the
+same model, messages and sampling options always find the same entry
+however the request was put together. Whether the response was
+streamed is left out of the key.
+
+Entries older than the time to live are ignored and then evicted, and
+the least recently used entries are evicted once the cache holds more
+than max_entries of them. The database is opened in WAL mode and every
+store is committed at once, so several processes can share one cache.
+"""
+
+import hashlib
+import json
+import os
+import time
+from .openai_tokens_cache import default_cache_path
+
+# Define constants
+DEFAULT_CACHE_NAME = 'chat-responses.sqlite'
+DEFAULT_MAX_ENTRIES = 10000
+
+def request_key(api_params):
+    """Returns the SHA-256 hex digest of the canonical JSON form of api_params."""
+    params = {k: v for k, v in api_params.items() if k != 'stream'}
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """SQLite cache of chat completion responses, safe to share between processes."""
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, ttl=None, refresh=False):
+        self.path = path or default_cache_path(DEFAULT_CACHE_NAME)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.refresh = refresh
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        import sqlite3  # imported here to keep startup fast for runs without a cache
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                    'key TEXT PRIMARY KEY, response TEXT NOT NULL, '
+                                    'created REAL NOT NULL, last_used REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+
+    def _oldest_created(self):
+        return time.time() - self.ttl if self.ttl else 0
+
+    def lookup(self, api_params):
+        """Returns the cached response for api_params as a dict, or None on a miss."""
+        if self.refresh:
+            return None
+        key = request_key(api_params)
+        row = self.connection.execute('SELECT response FROM responses WHERE key = ? AND created >= ?',
+                                      (key, self._oldest_created())).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def store(self, api_params, response):
+        """Stores response for api_params."""
+        now = time.time()
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO responses (key, response, created, last_used) VALUES (?, ?, ?, ?)',
+                                    (request_key(api_params), json.dumps(response), now, now))
+
+    def close(self):
+        """Evicts expired entries and the least recently used entries beyond max_entries, and closes the database."""
+        with self.connection:
+            if self.ttl:
+                self.connection.execute('DELETE FROM responses WHERE created < ?', (self._oldest_created(),))
+            (entries,) = self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()
+            if entries > self.max_entries:
+                self._evict()
+        self.connection.close()
+
+    def _evict(self):
+        self.connection.execute('DELETE FROM responses WHERE rowid IN '
+                                '(SELECT rowid FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                                (self.max_entries,))
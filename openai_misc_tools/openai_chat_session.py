@@ -0,0 +1,73 @@
+"""
+Conversation state for interactive openai-chat sessions.
+
+A Conversation holds the messages sent so far and the number of tokens
+each one adds to a request, worked out once when the message is
+added. The size of the next request is kept as a running total, so
+checking it against the model's context window costs nothing however
+long the conversation gets.
+
+When the next request and its reply would not fit, the oldest turns
+(a user message and the replies that follow it) are dropped, keeping
+system messages and the latest turn.
+
+For a model whose chat message format is not known, each message is
+estimated from its content plus a few tokens, as for rate limits.
+"""
+
+import sys
+from . import openai_tokens
+
+# Define constants
+DEFAULT_REPLY_TOKENS = 1024
+
+class Conversation:
+    """The messages of a chat, trimmed to fit within the model's context window."""
+
+    def __init__(self, model, limit=None, reply_tokens=DEFAULT_REPLY_TOKENS):
+        self.model = model
+        self.limit = limit if limit is not None else openai_tokens.context_limit(model)
+        self.reply_tokens = reply_tokens
+        self.messages = []
+        self.counts = []
+        # Every request costs a few tokens for priming the reply, whatever its messages
+        self.base_tokens = openai_tokens.estimate_tokens_from_messages([], model)
+        self.total = self.base_tokens
+
+    def append(self, message):
+        """Adds message to the conversation, counting its tokens once."""
+        num_tokens = openai_tokens.estimate_tokens_from_messages([message], self.model) - self.base_tokens
+        self.messages.append(message)
+        self.counts.append(num_tokens)
+        self.total += num_tokens
+
+    def pop(self):
+        """Removes and returns the latest message."""
+        self.total -= self.counts.pop()
+        return self.messages.pop()
+
+    def trim(self):
+        """Drops the oldest turns until the request and its reply fit the context window, returning how many messages were dropped."""
+        dropped = 0
+        while self.limit is not None and self.total + self.reply_tokens > self.limit:
+            start = self._oldest_turn()
+            if start is None:
+                print(f"Warning: the conversation needs {self.total} tokens plus {self.reply_tokens} for the reply, "
+                      f"more than the {self.limit} token limit, even after trimming.", file=sys.stderr)
+                break
+            end = start + 1
+            while end < len(self.messages) and self.messages[end]["role"] not in ("user", "system"):
+                end += 1
+            self.total -= sum(self.counts[start:end])
+            dropped += end - start
+            del self.messages[start:end]
+            del self.counts[start:end]
+        return dropped
+
+    def _oldest_turn(self):
+        """Returns the index of the first non-system message, unless it starts the latest turn."""
+        indexes = [i for i, message in enumerate(self.messages) if message["role"] != "system"]
+        latest_user = max((i for i in indexes if self.messages[i]["role"] == "user"), default=None)
+        if not indexes or indexes[0] == latest_user:
+            return None
+        return indexes[0]
@@ -0,0 +1,165 @@
+"""
+Async client for embedding the tools in long-running services.
+
+An AsyncClient holds the credentials of one project, taken from the
+same INI configuration file the command line tools read, and one
+aiohttp session whose keep-alive connections are reused by every call.
+It never touches the openai module's global settings: the API key,
+organization and API base are passed with each request, and the session
+is set only in the context of the calling task. Several clients for
+different projects can therefore serve requests concurrently in one
+process.
+
+Requests are retried like the command line tools' requests, and wait
+for the project's shared rate limits if its configuration sets any.
+Token counting runs on a thread pool, since tiktoken releases the GIL.
+
+Example:
+
+    async with AsyncClient.from_config(project='MyProject') as client:
+        response = await client.chat([{"role": "user", "content": "Why is the sky blue?"}])
+        text = await client.transcribe('meeting.mp3')
+        num_tokens = await client.count_tokens(text)
+"""
+
+import configparser
+import os
+from . import openai_rate_limit
+from . import openai_retry
+from . import openai_tokens
+
+# Define constants
+DEFAULT_CONFIG_FILE = '~/.openai.conf'
+DEFAULT_PROJECT = 'default'
+DEFAULT_CHAT_MODEL = 'gpt-4-0613'
+DEFAULT_TRANSCRIBE_MODEL = 'whisper-1'
+DEFAULT_CONNECTIONS = 100
+
+class AsyncClient:
+    """An OpenAI API client for one project, with its own credentials and connection pool."""
+
+    def __init__(self, api_key, organization=None, api_base=None, max_retries=openai_retry.DEFAULT_MAX_RETRIES,
+                 connections=DEFAULT_CONNECTIONS, requests_per_minute=None, tokens_per_minute=None):
+        self.api_key = api_key
+        self.organization = organization
+        self.api_base = api_base
+        self.max_retries = max_retries
+        self.connections = connections
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._session = None
+        self._limiters = {}
+
+    @classmethod
+    def from_config(cls, config_file=None, project=DEFAULT_PROJECT, **kwargs):
+        """Returns a client for project from config_file, which defaults to $OPENAI_CONFIG or ~/.openai.conf."""
+        config_file = config_file or os.getenv('OPENAI_CONFIG', DEFAULT_CONFIG_FILE)
+        config = configparser.ConfigParser()
+        config.read(os.path.expanduser(config_file))
+        project_config = config[project]
+        return cls(project_config['api_key'],
+                   organization=project_config.get('org_id'),
+                   api_base=project_config.get('api_base'),
+                   requests_per_minute=project_config.getint('requests_per_minute', fallback=None),
+                   tokens_per_minute=project_config.getint('tokens_per_minute', fallback=None),
+                   **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """Closes the connection pool. The client opens a new one if it is used again."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        for limiter in self._limiters.values():
+            if limiter is not None:
+                limiter.close()
+        self._limiters = {}
+
+    def _credentials(self):
+        credentials = {'api_key': self.api_key}
+        if self.organization:
+            credentials['organization'] = self.organization
+        if self.api_base:
+            credentials['api_base'] = self.api_base
+        return credentials
+
+    def _limiter(self, model):
+        if model not in self._limiters:
+            self._limiters[model] = None
+            if self.requests_per_minute or self.tokens_per_minute:
+                self._limiters[model] = openai_rate_limit.RateLimiter(self.api_key, model, self.requests_per_minute,
+                                                                      self.tokens_per_minute)
+        return self._limiters[model]
+
+    async def _request(self, function, params, tokens=0):
+        """Returns await function(**params) using this client's credentials and session, with retries and rate limits."""
+        import aiohttp
+        import openai
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connections))
+        limiter = self._limiter(params['model'])
+
+        async def attempt():
+            if limiter is not None:
+                await limiter.aacquire(tokens)
+            if 'file' in params:
+                params['file'].seek(0)  # a retry sends the whole file again
+            # The session is set for the calling task only, so other clients are unaffected
+            token = openai.aiosession.set(self._session)
+            try:
+                return await function(**params, **self._credentials())
+            finally:
+                openai.aiosession.reset(token)
+
+        return await openai_retry.acall_with_retries(attempt, max_retries=self.max_retries)
+
+    async def chat(self, messages, model=DEFAULT_CHAT_MODEL, **params):
+        """Returns the chat completion response for messages as a dict, passing params such as temperature to the API."""
+        import openai
+        api_params = dict(params, model=model, messages=messages)
+        limiter = self._limiter(model)
+        tokens = 0
+        if limiter is not None and limiter.tokens_per_minute:
+            tokens = await self._in_thread(openai_rate_limit.estimate_tokens, api_params)
+        response = await self._request(openai.ChatCompletion.acreate, api_params, tokens)
+        if limiter is not None and limiter.tokens_per_minute:
+            limiter.charge(response['usage']['total_tokens'] - tokens)
+        return response.to_dict_recursive()
+
+    async def stream_chat(self, messages, model=DEFAULT_CHAT_MODEL, **params):
+        """Yields the content of the chat completion for messages as it is generated."""
+        import openai
+        api_params = dict(params, model=model, messages=messages, stream=True)
+        chunks = await self._request(openai.ChatCompletion.acreate, api_params)
+        async for chunk in chunks:
+            content = chunk['choices'][0].get('delta', {}).get('content')
+            if content:
+                yield content
+
+    async def transcribe(self, file, model=DEFAULT_TRANSCRIBE_MODEL, **params):
+        """Returns the text of the audio in file, a path or a binary file object with a name, within the API's upload size limit."""
+        import openai
+        if isinstance(file, (str, bytes, os.PathLike)):
+            with open(file, 'rb') as audio_file:
+                response = await self._request(openai.Audio.atranscribe, dict(params, model=model, file=audio_file))
+        else:
+            response = await self._request(openai.Audio.atranscribe, dict(params, model=model, file=file))
+        return response['text']
+
+    async def count_tokens(self, text, model=DEFAULT_CHAT_MODEL):
+        """Returns the number of tokens in text."""
+        return await self._in_thread(lambda: openai_tokens.get_token_counter(model).count(text))
+
+    async def count_message_tokens(self, messages, model=DEFAULT_CHAT_MODEL):
+        """Returns the number of tokens used by a list of messages."""
+        return await self._in_thread(openai_tokens.num_tokens_from_messages, messages, model)
+
+    @staticmethod
+    async def _in_thread(function, *args):
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
@@ -0,0 +1,168 @@
+"""
+Per-stage timing and usage metrics for the command line tools.
+
+Metrics are off unless a tool calls enable(), normally because it was
+given --metrics FILE. Until then stage() and add() do nothing, so the
+library code can call them freely.
+
+Once enabled, stage(name) records the wall time and CPU time spent in
+each named stage, counting the CPU time of child processes such as
+ffmpeg, and add(name, value) adds to named counters such as bytes
+uploaded, tokens used and retries. write(path) then appends one JSON
+line for the run to path, or, if path ends in .prom, replaces it with a
+Prometheus textfile for the node_exporter textfile collector. Both
+include the total run time and the peak resident set size.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+# Define constants
+PROMETHEUS_SUFFIX = '.prom'
+PROMETHEUS_PREFIX = 'openai_misc_tools'
+
+def cpu_time():
+    """Returns the CPU time used by this process and its waited-for children, in seconds."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def peak_rss_bytes(who='self'):
+    """Returns the peak resident set size of this process, or of its largest child if who is 'children', or None if unknown."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+class Recorder:
+    """Stage timings and counters for one run of one tool, safe to update from several threads."""
+
+    def __init__(self, tool):
+        self.tool = tool
+        self.start_wall = time.perf_counter()
+        self.start_cpu = cpu_time()
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start_wall = time.perf_counter()
+        start_cpu = cpu_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = cpu_time() - start_cpu
+            with self.lock:
+                stage = self.stages.setdefault(name, {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+                stage["count"] += 1
+                stage["wall_seconds"] += wall
+                stage["cpu_seconds"] += cpu
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """Returns the metrics of the run so far as a dict."""
+        with self.lock:
+            return {
+                "tool": self.tool,
+                "time": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                "pid": os.getpid(),
+                "wall_seconds": time.perf_counter() - self.start_wall,
+                "cpu_seconds": cpu_time() - self.start_cpu,
+                "peak_rss_bytes": peak_rss_bytes(),
+                "children_peak_rss_bytes": peak_rss_bytes('children'),
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+    def write(self, path):
+        """Appends the metrics as a JSON line to path, or writes them as a Prometheus textfile if path ends in .prom."""
+        summary = self.summary()
+        if path.endswith(PROMETHEUS_SUFFIX):
+            # Write a whole new file and rename it, so the collector never reads half of one
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, 'w') as file:
+                file.write(format_prometheus(summary))
+            os.replace(temporary_path, path)
+        else:
+            # One write of one line, so runs appending to the same file don't interleave
+            line = json.dumps(summary) + '\n'
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode('utf-8'))
+            finally:
+                os.close(fd)
+
+def format_prometheus(summary):
+    """Returns summary in the Prometheus text exposition format."""
+    tool = summary["tool"]
+    lines = []
+
+    def gauge(name, help_text, samples):
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge")
+        for labels, value in samples:
+            label_text = ','.join(f'{label}="{label_value}"' for label, label_value in [("tool", tool)] + labels)
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}")
+
+    gauge("run_wall_seconds", "Wall time of the last run.", [([], summary["wall_seconds"])])
+    gauge("run_cpu_seconds", "CPU time of the last run, including child processes.", [([], summary["cpu_seconds"])])
+    if summary["peak_rss_bytes"] is not None:
+        gauge("peak_rss_bytes", "Peak resident set size of the last run.", [([], summary["peak_rss_bytes"])])
+    stages = sorted(summary["stages"].items())
+    gauge("stage_wall_seconds", "Wall time spent in each stage of the last run.",
+          [([("stage", name)], stage["wall_seconds"]) for name, stage in stages])
+    gauge("stage_cpu_seconds", "CPU time spent in each stage of the last run, including child processes.",
+          [([("stage", name)], stage["cpu_seconds"]) for name, stage in stages])
+    gauge("stage_count", "Number of times each stage ran in the last run.",
+          [([("stage", name)], stage["count"]) for name, stage in stages])
+    for name, value in sorted(summary["counters"].items()):
+        gauge(name, f"Total {name.replace('_', ' ')} in the last run.", [([], value)])
+    gauge("last_run_timestamp_seconds", "Time the last run finished.", [([], time.time())])
+    return '\n'.join(lines) + '\n'
+
+_recorder = None
+
+def enable(tool):
+    """Starts recording metrics for tool, returning the Recorder."""
+    global _recorder
+    _recorder = Recorder(tool)
+    return _recorder
+
+def enabled():
+    """Returns whether metrics are being recorded."""
+    return _recorder is not None
+
+def stage(name):
+    """Returns a context manager that records the time spent in it as stage name, if metrics are enabled."""
+    if _recorder is None:
+        return contextlib.nullcontext()
+    return _recorder.stage(name)
+
+def add(name, value=1):
+    """Adds value to the counter name, if metrics are enabled."""
+    if _recorder is not None:
+        _recorder.add(name, value)
+
+def add_usage(response):
+    """Adds the token usage reported in an API response to the token counters, if metrics are enabled."""
+    if _recorder is not None:
+        usage = response.get('usage') or {}
+        for key in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+            if key in usage:
+                _recorder.add(key, usage[key])
+
+def write(path):
+    """Writes the metrics recorded so far to path, if metrics are enabled."""
+    if _recorder is not None:
+        _recorder.write(path)
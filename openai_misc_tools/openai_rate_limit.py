@@ -0,0 +1,123 @@
+"""
+Host-wide rate limiting for OpenAI API requests.
+
+Every process using the same API key on a host shares one token bucket
+per model for requests per minute and, optionally, one for tokens per
+minute. The buckets live in a small SQLite database, so concurrent
+openai-chat and openai-transcribe processes see each other's requests.
+
+Each bucket holds up to one minute's allowance and refills
+continuously. A request takes what it needs from its buckets at once,
+even if that leaves them in debt, and then waits until the debt would
+have been repaid. Because a later request sees the debt of earlier
+ones, waiting requests go out in the order they arrived, spread
+evenly, rather than all at once. The wait happens locally, before the
+request is sent, instead of as a 429 error from the API.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from . import openai_metrics
+from .openai_tokens_cache import default_cache_path
+
+# Define constants
+DEFAULT_STATE_NAME = 'rate-limits.sqlite'
+
+def rate_limiter_from_config(project_config, model):
+    """Returns a RateLimiter for model if the project configuration section sets requests_per_minute or tokens_per_minute, otherwise None."""
+    requests_per_minute = project_config.getint('requests_per_minute', fallback=None)
+    tokens_per_minute = project_config.getint('tokens_per_minute', fallback=None)
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+    return RateLimiter(project_config['api_key'], model, requests_per_minute, tokens_per_minute)
+
+def estimate_tokens(api_params):
+    """Returns the number of tokens a chat completion request counts against the tokens per minute limit.
+
+    This is the prompt size plus max_tokens, if set; the rest of the
+    reply is charged once its usage is known.
+    """
+    from . import openai_tokens
+    # Values that are not text, like a null content beside a function_call, are left out of the estimate
+    messages = [{key: value for key, value in message.items() if isinstance(value, str)}
+                for message in api_params['messages']]
+    prompt_tokens = openai_tokens.estimate_tokens_from_messages(messages, api_params['model'])
+    return prompt_tokens + (api_params.get('max_tokens') or 0)
+
+class RateLimiter:
+    """Shared request and token budgets for one API key and model."""
+
+    def __init__(self, api_key, model, requests_per_minute=None, tokens_per_minute=None, path=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # Buckets are named after a hash of the key, so the key itself is not stored
+        key_id = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+        self.prefix = f"{key_id}:{model}:"
+        self.path = path or default_cache_path(DEFAULT_STATE_NAME)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        import sqlite3  # imported here to keep startup fast for runs without a limit
+        # openai-transcribe uploads on several threads, which share the connection under a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS buckets ('
+                                'name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)')
+
+    def reserve(self, tokens=0, requests=1):
+        """Takes requests and tokens from the shared buckets, returning the number of seconds to wait before sending."""
+        amounts = []
+        if self.requests_per_minute and requests:
+            amounts.append(('requests', requests, self.requests_per_minute))
+        if self.tokens_per_minute and tokens:
+            amounts.append(('tokens', tokens, self.tokens_per_minute))
+        if not amounts:
+            return 0
+
+        wait = 0
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                for bucket, amount, per_minute in amounts:
+                    name = self.prefix + bucket
+                    rate = per_minute / 60
+                    row = self.connection.execute('SELECT level, updated FROM buckets WHERE name = ?', (name,)).fetchone()
+                    level = per_minute if row is None else min(per_minute, row[0] + max(now - row[1], 0) * rate)
+                    level -= amount
+                    self.connection.execute('INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)',
+                                            (name, level, now))
+                    if level < 0:
+                        wait = max(wait, -level / rate)
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+        return wait
+
+    def acquire(self, tokens=0, requests=1):
+        """Reserves requests and tokens, sleeping until they may be used."""
+        wait = self.reserve(tokens, requests)
+        if wait > 0:
+            with openai_metrics.stage('rate_limit_wait'):
+                time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens=0, requests=1):
+        """Reserves requests and tokens, sleeping asynchronously until they may be used."""
+        import asyncio
+        wait = self.reserve(tokens, requests)
+        if wait > 0:
+            with openai_metrics.stage('rate_limit_wait'):
+                await asyncio.sleep(wait)
+        return wait
+
+    def charge(self, tokens):
+        """Takes tokens used beyond those reserved from the tokens bucket, without waiting."""
+        if tokens > 0:
+            self.reserve(tokens, requests=0)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
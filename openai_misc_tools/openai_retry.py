@@ -0,0 +1,69 @@
+"""
+Retries for OpenAI API calls.
+
+Rate limit (429) and server (5xx) errors, timeouts and dropped
+connections are retried after an exponentially growing delay with
+random jitter, so that many clients backing off at once don't all come
+back at the same moment. When the server sends a Retry-After header,
+its delay is used instead. Other errors are raised at once.
+"""
+
+import random
+import time
+from . import openai_metrics
+
+# Define constants
+DEFAULT_MAX_RETRIES = 5
+INITIAL_DELAY = 1.0
+MAX_DELAY = 60.0
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+def is_retryable(error):
+    """Returns whether error is a transient OpenAI API error worth retrying."""
+    import openai
+    if isinstance(error, (openai.error.Timeout, openai.error.APIConnectionError, openai.error.TryAgain)):
+        return True
+    return isinstance(error, openai.error.OpenAIError) and error.http_status in RETRYABLE_STATUSES
+
+def retry_delay(error, attempt):
+    """Returns the number of seconds to wait before retry number attempt, counting from 0."""
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return min(float(headers.get('retry-after')), MAX_DELAY)
+    except (TypeError, ValueError):
+        pass
+    delay = min(INITIAL_DELAY * 2 ** attempt, MAX_DELAY)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def call_with_retries(function, *args, max_retries=DEFAULT_MAX_RETRIES, on_retry=None, **kwargs):
+    """Returns function(*args, **kwargs), retrying transient API errors up to max_retries times.
+
+    on_retry, if given, is called with the error, the attempt number and
+    the delay before each retry.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            openai_metrics.add('retries')
+            if on_retry is not None:
+                on_retry(e, attempt, delay)
+            time.sleep(delay)
+
+async def acall_with_retries(function, *args, max_retries=DEFAULT_MAX_RETRIES, on_retry=None, **kwargs):
+    """Returns await function(*args, **kwargs), retrying transient API errors up to max_retries times."""
+    import asyncio
+    for attempt in range(max_retries + 1):
+        try:
+            return await function(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            openai_metrics.add('retries')
+            if on_retry is not None:
+                on_retry(e, attempt, delay)
+            await asyncio.sleep(delay)
@@ -1,37 +1,289 @@
-import tiktoken
+import collections
+import functools
+import json
+import re
+import sys
+from . import openai_metrics
+
+# tiktoken, and concurrent.futures which pulls in logging, are imported
+# only where they are used so that loading this module stays fast
+
+# Number of characters read at a time when streaming a file
+CHUNK_SIZE = 1024 * 1024
+
+# Fewest characters read at a time when only the head of a file is needed
+HEAD_CHUNK_SIZE = 4096
+
+# A letter or digit followed by ASCII punctuation other than an apostrophe
+PUNCTUATION_SPLIT = re.compile(r"[^\W_][!-&(-/:-@\[-`{-~]")
+
+# Number of characters searched at a time, from the end, for PUNCTUATION_SPLIT
+PUNCTUATION_WINDOW = 4096
+
+# Number of threads count_many encodes on by default
+DEFAULT_NUM_THREADS = 8
+
+# Tokens added per message and per name, for each model with a known chat message format
+MESSAGE_FORMATS = {
+    "gpt-3.5-turbo-0301": (4, -1),  # every message follows <|start|>{role/name}\n{content}<|end|>\n; if there's a name, the role is omitted
+    "gpt-4-0314": (3, 1),
+    "gpt-4-32k-0314": (3, 1),
+    "gpt-3.5-turbo-0613": (3, 1),
+    "gpt-3.5-turbo-16k-0613": (3, 1),
+    "gpt-4-0613": (3, 1),
+    "gpt-4-32k-0613": (3, 1),
+}
+
+# Context window in tokens, for each model family
+CONTEXT_LIMITS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+}
+
+# Models that may change over time, counted as the snapshot they pointed to
+MODEL_ALIASES = {
+    "gpt-3.5-turbo": "gpt-3.5-turbo-0301",
+    "gpt-4": "gpt-4-0314",
+}
+
+def context_limit(model):
+    """Returns the context window of model in tokens, or None if it is not known."""
+    family = max((name for name in CONTEXT_LIMITS if model == name or model.startswith(name + "-")), key=len, default=None)
+    return CONTEXT_LIMITS.get(family)
+
+def encoding_for_model(model):
+    """Returns the tiktoken encoding for model, falling back to cl100k_base."""
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        print("Warning: model not found. Using cl100k_base encoding.", file=sys.stderr)
+        return tiktoken.get_encoding("cl100k_base")
+
+def read_jsonl_records(file):
+    """Yields (line number, record) for each chat request record in a JSON lines file, warning about and skipping bad lines."""
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record.get("messages"), list):
+                raise ValueError('no "messages" list')
+        except (ValueError, AttributeError) as e:
+            print(f"Warning: skipping {file.name} line {line_number}: {e}", file=sys.stderr)
+            continue
+        yield line_number, record
+
+def find_split_point(text, start=0):
+    """Returns the last index at or after start where text can be cut without changing its tokens, or 0 if none.
+
+    A cut is safe just before a space that follows a non-whitespace
+    character, just after a newline that sits between a
+    non-whitespace character and a letter or digit, and between a
+    letter or digit and ASCII punctuation other than an apostrophe, so
+    that text without spaces, like minified JSON, is cut too: none of
+    the encodings' split patterns let a piece run across any of these
+    points, and no piece looks behind it.
+    """
+    start = max(start, 1)
+    space = text.rfind(' ', start)
+    while space > 0 and text[space - 1].isspace():
+        space = text.rfind(' ', start, space)
+    newline = text.rfind('\n', start - 1, len(text) - 1)
+    while newline > 0 and (text[newline - 1].isspace() or not text[newline + 1].isalnum()):
+        newline = text.rfind('\n', start - 1, newline)
+    split = max(space, newline + 1 if newline > 0 else 0, 0)
+    # Search back from the end a window at a time, since only the last cut is wanted
+    first = max(start - 1, split)
+    end = len(text)
+    while True:
+        begin = max(first, end - PUNCTUATION_WINDOW)
+        match = None
+        for match in PUNCTUATION_SPLIT.finditer(text, begin, end):
+            pass
+        if match is not None:
+            return match.start() + 1
+        if begin == first:
+            return split
+        end = begin + 1  # a pair may straddle the windows
+
+def iter_text_chunks(file, chunk_size=CHUNK_SIZE):
+    """Yields consecutive pieces of file that encode to the same tokens separately as they do together."""
+    pending = ''
+    while True:
+        data = file.read(chunk_size)
+        if not data:
+            break
+        openai_metrics.add('characters_read', len(data))
+        # Only the newly read text (and the character before it) can hold a new split point
+        start = max(len(pending) - 1, 0)
+        pending += data
+        split = find_split_point(pending, start)
+        if split > 0:
+            yield pending[:split]
+            pending = pending[split:]
+    if pending:
+        yield pending
+
+class TokenCounter:
+    """Counts tokens for one model, resolving its encoding only once.
+
+    Use get_token_counter to share one counter per model across calls.
+    encoding may be given to use an already loaded tiktoken encoding, or
+    anything with the same encode and decode methods.
+    """
+
+    def __init__(self, model, encoding=None):
+        self.model = model
+        self.encoding = encoding if encoding is not None else encoding_for_model(model)
+        self.message_model = MODEL_ALIASES.get(model, model)
+        self._warned = False
+
+    def count(self, text):
+        """Returns the number of tokens in text."""
+        return len(self.encoding.encode(text))
+
+    def count_many(self, texts, num_threads=DEFAULT_NUM_THREADS):
+        """Returns the number of tokens in each of texts, encoding on up to num_threads threads."""
+        texts = list(texts)
+        if num_threads <= 1 or len(texts) <= 1:
+            return [self.count(text) for text in texts]
+        # Give each thread one contiguous slice, so short texts don't pay for a task each
+        import concurrent.futures
+        size = -(-len(texts) // num_threads)
+        slices = [texts[i:i + size] for i in range(0, len(texts), size)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
+            counts = executor.map(lambda texts: [self.count(text) for text in texts], slices)
+            return [num_tokens for slice_counts in counts for num_tokens in slice_counts]
+
+    def message_format(self):
+        """Returns (tokens_per_message, tokens_per_name) for the model's chat message format."""
+        if self.message_model != self.model and not self._warned:
+            print(f"Warning: {self.model} may change over time. Returning num tokens assuming {self.message_model}.", file=sys.stderr)
+            self._warned = True
+        try:
+            return MESSAGE_FORMATS[self.message_model]
+        except KeyError:
+            raise NotImplementedError(f"""num_tokens_from_messages() is not implemented for model {self.model}. See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens.""")
+
+    # The message accounting is copied from num_tokens_from_messages in the OpenAI cookbook:
+    # https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+    def count_messages(self, messages):
+        """Returns the number of tokens used by a list of messages."""
+        tokens_per_message, tokens_per_name = self.message_format()
+        num_tokens = 0
+        for message in messages:
+            num_tokens += tokens_per_message
+            for key, value in message.items():
+                num_tokens += self.count(value)
+                if key == "name":
+                    num_tokens += tokens_per_name
+        num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
+        return num_tokens
+
+    def count_messages_many(self, conversations, num_threads=DEFAULT_NUM_THREADS):
+        """Returns the number of tokens used by each of a list of message lists, encoding all their values in one batch."""
+        tokens_per_message, tokens_per_name = self.message_format()
+        values = [value for messages in conversations for message in messages for value in message.values()]
+        value_counts = iter(self.count_many(values, num_threads))
+        results = []
+        for messages in conversations:
+            num_tokens = 3  # every reply is primed with <|start|>assistant<|message|>
+            for message in messages:
+                num_tokens += tokens_per_message
+                for key in message:
+                    num_tokens += next(value_counts)
+                    if key == "name":
+                        num_tokens += tokens_per_name
+            results.append(num_tokens)
+        return results
+
+    def count_file(self, file):
+        """Returns the number of tokens in file, reading and encoding it one chunk at a time."""
+        return sum(self.count(chunk) for chunk in iter_text_chunks(file))
+
+    def count_files(self, files, jobs):
+        """Returns the number of tokens in each of files, encoding chunks on up to jobs threads at once.
+
+        tiktoken releases the GIL while encoding, so threads scale across
+        cores both for many small files and for the chunks of one large file.
+        """
+        import concurrent.futures
+        counts = [0] * len(files)
+
+        # Keep a bounded number of chunks in flight so memory use stays flat
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            pending = collections.deque()
+            for i, file in enumerate(files):
+                for chunk in iter_text_chunks(file):
+                    pending.append((i, executor.submit(self.count, chunk)))
+                    if len(pending) >= 2 * jobs:
+                        index, future = pending.popleft()
+                        counts[index] += future.result()
+            for index, future in pending:
+                counts[index] += future.result()
+        return counts
+
+    def head(self, text, count):
+        """Returns the first count tokens from text."""
+        tokens = self.encoding.encode(text)
+        return self.encoding.decode(tokens[:count])
+
+    def head_file(self, file, count):
+        """Returns the first count tokens from file, reading and encoding only as much of it as needed."""
+        if count < 0:
+            return self.head(file.read(), count)
+        if count == 0:
+            return ''
+        # Read about as much text as count tokens take, so latency follows count rather than file size
+        chunk_size = min(max(count * 8, HEAD_CHUNK_SIZE), CHUNK_SIZE)
+        tokens = []
+        for chunk in iter_text_chunks(file, chunk_size):
+            tokens.extend(self.encoding.encode(chunk))
+            if len(tokens) >= count:
+                break
+        return self.encoding.decode(tokens[:count])
+
+    def split_file(self, file, count, overlap=0):
+        """Yields (start, end, text) for consecutive windows of count tokens from file, each repeating the last overlap tokens of the one before.
+
+        The file is read and encoded once, one chunk at a time; start
+        and end are token offsets into the whole file.
+        """
+        step = count - overlap
+        tokens = []
+        offset = 0  # token offset of tokens[0] within the file
+        for chunk in iter_text_chunks(file):
+            tokens.extend(self.encoding.encode(chunk))
+            position = 0
+            while len(tokens) - position >= count:
+                yield offset + position, offset + position + count, self.encoding.decode(tokens[position:position + count])
+                position += step
+            tokens = tokens[position:]
+            offset += position
+        # The remaining tokens make a shorter last window, unless the previous window already held them all
+        if tokens and (offset == 0 or len(tokens) > overlap):
+            yield offset, offset + len(tokens), self.encoding.decode(tokens)
+
+@functools.lru_cache(maxsize=None)
+def get_token_counter(model):
+    """Returns the shared TokenCounter for model."""
+    return TokenCounter(model)
 
-# The function num_tokens_from_messages is copied from the OpenAI cookbook: 
-# https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
 def num_tokens_from_messages(messages, model="gpt-3.5-turbo-0301"):
     """Returns the number of tokens used by a list of messages."""
+    return get_token_counter(model).count_messages(messages)
+
+def estimate_tokens_from_messages(messages, model):
+    """Returns the number of tokens used by a list of messages, estimated from their content if the model's message format is not known."""
     try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        print("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    if model == "gpt-3.5-turbo":
-        print("Warning: gpt-3.5-turbo may change over time. Returning num tokens assuming gpt-3.5-turbo-0301.")
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo-0301")
-    elif model == "gpt-4":
-        print("Warning: gpt-4 may change over time. Returning num tokens assuming gpt-4-0314.")
-        return num_tokens_from_messages(messages, model="gpt-4-0314")
-    elif model == "gpt-3.5-turbo-0301":
-        tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
-        tokens_per_name = -1  # if there's a name, the role is omitted
-    elif model == "gpt-4-0314":
-        tokens_per_message = 3
-        tokens_per_name = 1
-    else:
-        raise NotImplementedError(f"""num_tokens_from_messages() is not implemented for model {model}. See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens.""")
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-    return num_tokens
+        return num_tokens_from_messages(messages, model)
+    except NotImplementedError:
+        # Unknown message format: count the content alone, plus a few tokens per message
+        counter = get_token_counter(model)
+        return sum(4 + counter.count(str(message.get('content') or '')) for message in messages)
 
 def count_tokens_in_text(text, model):
     # Here we assume the text from each file is a single message
@@ -39,24 +291,50 @@ def count_tokens_in_text(text, model):
     num_tokens = num_tokens_from_messages(message, model)
     return num_tokens
 
-def count_tokens_in_file(file, model):
-    text = file.read()
-    num_tokens = count_tokens_in_text(text, model)
+def count_tokens_in_file(file, model, cache=None, counter=None):
+    """Returns the number of tokens in file, reading and encoding it one chunk at a time.
+
+    If cache is a TokenCountCache, an unchanged file is not encoded again.
+    counter may be given to use a TokenCounter other than the shared one.
+    """
+    counter = counter or get_token_counter(model)
+    # The chat message overhead is the token count of an empty file
+    overhead = counter.count_messages([{"role": "user", "content": ""}])
+    if cache is None:
+        return overhead + counter.count_file(file)
+    num_tokens, entry = cache.lookup(file, counter.encoding.name)
     if num_tokens is None:
-        print(f"Warning: token count failed for {file.name}")
-        num_tokens = 0
-    return num_tokens
+        num_tokens = counter.count_file(file)
+        cache.store(entry, counter.encoding.name, num_tokens)
+    return overhead + num_tokens
+
+def count_tokens_in_files(files, model, jobs, cache=None, counter=None):
+    """Returns the number of tokens in each of files, encoding chunks on up to jobs threads at once.
+
+    If cache is a TokenCountCache, only files missing from it are encoded.
+    """
+    counter = counter or get_token_counter(model)
+    overhead = counter.count_messages([{"role": "user", "content": ""}])
+    counts = [None] * len(files)
+    entries = [None] * len(files)
+    if cache is not None:
+        for i, file in enumerate(files):
+            counts[i], entries[i] = cache.lookup(file, counter.encoding.name)
+    missing = [i for i, num_tokens in enumerate(counts) if num_tokens is None]
+    for i, num_tokens in zip(missing, counter.count_files([files[i] for i in missing], jobs)):
+        counts[i] = num_tokens
+        if cache is not None:
+            cache.store(entries[i], counter.encoding.name, num_tokens)
+    return [overhead + num_tokens for num_tokens in counts]
 
 def head_tokens_text(text, model, count):
     """Returns the first count tokens from text according to the model's encoding."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        print("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
+    return get_token_counter(model).head(text, count)
 
-    tokens = encoding.encode(text)
-    head_tokens = tokens[:count]
-    head_text = encoding.decode(head_tokens)
+def head_tokens_in_file(file, model, count, counter=None):
+    """Returns the first count tokens from file, reading only as much of it as needed."""
+    return (counter or get_token_counter(model)).head_file(file, count)
 
-    return head_text
+def split_tokens_in_file(file, model, count, overlap=0, counter=None):
+    """Yields (start, end, text) for consecutive windows of count tokens from file, overlapping by overlap tokens."""
+    return (counter or get_token_counter(model)).split_file(file, count, overlap)
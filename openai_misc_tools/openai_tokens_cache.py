@@ -0,0 +1,140 @@
+"""
+Persistent token count cache for openai-tokens-count.
+
+Counts are stored in an SQLite database keyed by a SHA-256 hash of
+the file content plus the encoding name, so a file is only encoded
+again when its content changes. A second table remembers the path,
+size and modification time each hash was computed for, so an unchanged
+file costs one stat() and one lookup instead of being read at all.
+
+Each new count is committed on its own as soon as it is known, so
+several processes can share one cache without holding each other up.
+A hit on an unchanged file writes nothing at the time: the counts used
+are marked as recently used together when the cache is closed, and
+the least recently used counts are evicted once the cache holds more
+than max_entries of them.
+"""
+
+import hashlib
+import os
+import time
+
+# Define constants
+DEFAULT_CACHE_NAME = 'token-counts.sqlite'
+DEFAULT_MAX_ENTRIES = 1000000
+HASH_CHUNK_SIZE = 1024 * 1024
+TOUCH_BATCH_SIZE = 1000
+
+def default_cache_path(name):
+    """Returns the path for name under $XDG_CACHE_HOME/openai-misc-tools, or ~/.cache/openai-misc-tools."""
+    cache_home = os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_home, 'openai-misc-tools', name)
+
+def file_stat(file):
+    """Returns os.stat_result for file if it is a seekable regular file, otherwise None."""
+    try:
+        stat = os.fstat(file.fileno())
+    except (AttributeError, OSError, ValueError):
+        return None
+    if not os.path.isfile(file.name) or not file.seekable():
+        return None
+    return stat
+
+def hash_file(file):
+    """Returns the SHA-256 hex digest of the text in file, leaving it positioned at the start."""
+    digest = hashlib.sha256()
+    while True:
+        data = file.read(HASH_CHUNK_SIZE)
+        if not data:
+            break
+        digest.update(data.encode('utf-8', 'surrogatepass'))
+    file.seek(0)
+    return digest.hexdigest()
+
+class TokenCountCache:
+    """SQLite cache of token counts, safe to share between processes."""
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, refresh=False):
+        self.path = path or default_cache_path(DEFAULT_CACHE_NAME)
+        self.max_entries = max_entries
+        self.refresh = refresh
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        import sqlite3  # imported here to keep startup fast for runs without a cache
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        # A commit per file only needs to reach the disk at checkpoints; a crash can lose a few counts, not the cache
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.used = set()
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS counts ('
+                                    'digest TEXT NOT NULL, encoding TEXT NOT NULL, tokens INTEGER NOT NULL, '
+                                    'last_used REAL NOT NULL, PRIMARY KEY (digest, encoding))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS counts_last_used ON counts (last_used)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS files ('
+                                    'path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, '
+                                    'digest TEXT NOT NULL)')
+
+    def lookup(self, file, encoding):
+        """Returns (tokens, entry) for file, where tokens is None on a miss and entry is passed to store."""
+        stat = file_stat(file)
+        if stat is None:
+            return None, None
+        path = os.path.abspath(file.name)
+        row = self.connection.execute('SELECT digest FROM files WHERE path = ? AND size = ? AND mtime_ns = ?',
+                                      (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        known = row is not None
+        digest = row[0] if known else hash_file(file)
+        entry = (path, stat.st_size, stat.st_mtime_ns, digest)
+        if self.refresh:
+            return None, entry
+        row = self.connection.execute('SELECT tokens FROM counts WHERE digest = ? AND encoding = ?',
+                                      (digest, encoding)).fetchone()
+        if row is None:
+            return None, entry
+        if not known:
+            # The same content under a new path or modification time
+            with self.connection:
+                self._record_file(entry)
+        self.used.add((digest, encoding))
+        return row[0], entry
+
+    def store(self, entry, encoding, tokens):
+        """Stores and commits the token count for a file looked up earlier."""
+        if entry is not None:
+            with self.connection:
+                self._record_file(entry)
+                self.connection.execute('INSERT OR REPLACE INTO counts (digest, encoding, tokens, last_used) '
+                                        'VALUES (?, ?, ?, ?)', (entry[3], encoding, tokens, time.time()))
+
+    def _record_file(self, entry):
+        self.connection.execute('INSERT OR REPLACE INTO files (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)', entry)
+
+    def prune(self):
+        """Evicts the least recently used counts beyond max_entries and forgets files that no longer exist."""
+        with self.connection:
+            self._evict()
+            missing = [(path,) for (path,) in self.connection.execute('SELECT path FROM files')
+                       if not os.path.exists(path)]
+            self.connection.executemany('DELETE FROM files WHERE path = ?', missing)
+            self.connection.execute('DELETE FROM files WHERE digest NOT IN (SELECT digest FROM counts)')
+
+    def close(self):
+        """Marks the counts used in this run as recently used, evicts beyond max_entries, and closes the database."""
+        now = time.time()
+        used = [(now, digest, encoding) for digest, encoding in self.used]
+        # Short transactions, so other processes are not kept waiting for the write lock
+        for i in range(0, len(used), TOUCH_BATCH_SIZE):
+            with self.connection:
+                self.connection.executemany('UPDATE counts SET last_used = ? WHERE digest = ? AND encoding = ?',
+                                            used[i:i + TOUCH_BATCH_SIZE])
+        self.used.clear()
+        (entries,) = self.connection.execute('SELECT COUNT(*) FROM counts').fetchone()
+        if entries > self.max_entries:
+            with self.connection:
+                self._evict()
+        self.connection.close()
+
+    def _evict(self):
+        self.connection.execute('DELETE FROM counts WHERE rowid IN '
+                                '(SELECT rowid FROM counts ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                                (self.max_entries,))
@@ -15,13 +15,73 @@ DESCRIPTION
     If no file is specified, or if the file is -, openai-tokens-count
     reads from standard input.
 
+    With --jsonl, each file is instead read as JSON lines chat
+    requests, each record holding a "messages" list as sent to the
+    chat completions API. The prompt token count of every record is
+    written to standard output as a JSON lines record giving the input
+    file name, the line number and "prompt_tokens", and summary
+    statistics are printed to standard error at the end. Records are
+    streamed and counted in batches, so memory use does not grow with
+    the number of records beyond one integer each for the statistics.
+    Only the text values of each message are counted, so a null
+    content beside a function_call or tool_calls is left out; a record
+    with a message that is not an object is skipped with a warning.
+
     The number of tokens and file name are then printed to standard
     output.
 
+    Input is read and encoded in chunks split at spaces, newlines and
+    punctuation after a letter or digit, so memory use stays flat no
+    matter how large the file or standard input is, and the count
+    matches encoding the whole text at once. Text with none of these
+    for long stretches, like a long run of letters or digits alone, is
+    held in memory until the next one.
+
 OPTIONS
     --model MODEL_NAME
         Specifies the OpenAI model to use for counting
         tokens. Defaults to "gpt-4-0314".
+
+    -j, --jobs N
+        Encode on up to N threads at once, spreading both separate
+        files and the chunks of a single large file across cores. 0
+        means one per CPU. Defaults to 1.
+
+    --jsonl
+        Count the prompt tokens of each chat request record in the
+        input files, as described above.
+
+    --context-limit N
+        With --jsonl, also report whether each record exceeds N prompt
+        tokens, and how many records do.
+
+    --cache
+        Remember token counts in an on-disk cache keyed by file content
+        and encoding, so unchanged files are not encoded again. Standard
+        input is never cached.
+
+    --cache-file FILE
+        Path to the cache database. Implies --cache. Defaults to
+        $XDG_CACHE_HOME/openai-misc-tools/token-counts.sqlite, or
+        ~/.cache/openai-misc-tools/token-counts.sqlite.
+
+    --cache-max-entries N
+        Evict the least recently used counts once the cache holds more
+        than N of them. Defaults to 1000000.
+
+    --cache-refresh
+        Bypass cached counts, encoding every file and storing the new
+        counts. Implies --cache.
+
+    --cache-prune
+        Evict counts beyond --cache-max-entries and forget files that
+        no longer exist, then exit.
+
+    --metrics FILE
+        Append the wall and CPU time spent loading the tokenizer and
+        counting, the characters read, the tokens counted and the peak
+        memory use to FILE as one JSON line, or write them to FILE as a
+        Prometheus textfile if its name ends in .prom.
     
     file
         The text file to count tokens in. Multiple files can be
@@ -41,6 +101,21 @@ EXAMPLES
     Count tokens using a different model:
     openai-tokens-count --model "gpt-3.5-turbo-0301" example.txt
 
+    Count tokens in a large corpus using every core:
+    openai-tokens-count --jobs 0 corpus/*.txt
+
+    Count the prompt tokens of each request in a JSON lines log:
+    openai-tokens-count --jsonl --jobs 0 --context-limit 8192 requests.jsonl > counts.jsonl
+
+    Count tokens in a corpus that is mostly unchanged since the last run:
+    openai-tokens-count --cache corpus/*.txt
+
+ENVIRONMENT
+    OPENAI_TOKENS_SOCKET
+        If an openai-tokens-serve server is listening on this socket
+        (see openai-tokens-serve for the default), tokens are counted
+        through it instead of loading tiktoken in-process.
+
 AUTHORS
     Written by GPT-4.
     Prompt engineering by Eric Hammond.
@@ -51,14 +126,66 @@ DATE
 """
 
 import argparse
+import bisect
+import itertools
+import json
+import math
+import os
 import sys
+from . import openai_metrics
 from . import openai_tokens
+from . import openai_tokens_cache
+from . import openai_tokens_serve
 
 
 # Constants
 #DEFAULT_MODEL = "gpt-4-0613"
 DEFAULT_MODEL = "gpt-4-0314"
 MIN_WIDTH = 7
+JSONL_BATCH_SIZE = 1000
+
+def percentile(sorted_values, fraction):
+    """Returns the nearest-rank percentile of a nonempty sorted list."""
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+def read_prompts(file):
+    """Yields (line number, messages) for each chat request record in file, keeping only the text values of each message."""
+    for line_number, record in openai_tokens.read_jsonl_records(file):
+        if not all(isinstance(message, dict) for message in record["messages"]):
+            print(f"Warning: skipping {file.name} line {line_number}: a message is not an object", file=sys.stderr)
+            continue
+        yield line_number, [{key: value for key, value in message.items() if isinstance(value, str)}
+                            for message in record["messages"]]
+
+def count_jsonl(files, counter, jobs, context_limit):
+    """Prints the prompt token count of each chat request record in files, then summary statistics."""
+    counts = []
+    for file in files:
+        records = read_prompts(file)
+        while True:
+            batch = list(itertools.islice(records, JSONL_BATCH_SIZE))
+            if not batch:
+                break
+            batch_counts = counter.count_messages_many([messages for _, messages in batch], jobs)
+            for (line_number, _), num_tokens in zip(batch, batch_counts):
+                result = {"file": file.name, "line": line_number, "prompt_tokens": num_tokens}
+                if context_limit is not None:
+                    result["over_limit"] = num_tokens > context_limit
+                print(json.dumps(result))
+            counts.extend(batch_counts)
+            openai_metrics.add('records', len(batch_counts))
+            openai_metrics.add('tokens', sum(batch_counts))
+
+    counts.sort()
+    print(f"records: {len(counts)}", file=sys.stderr)
+    if counts:
+        print(f"sum: {sum(counts)}", file=sys.stderr)
+        print(f"p50: {percentile(counts, 0.50)}", file=sys.stderr)
+        print(f"p95: {percentile(counts, 0.95)}", file=sys.stderr)
+        print(f"max: {counts[-1]}", file=sys.stderr)
+    if context_limit is not None:
+        over_limit = len(counts) - bisect.bisect_right(counts, context_limit)
+        print(f"over {context_limit}: {over_limit}", file=sys.stderr)
 
 def main():
     parser = argparse.ArgumentParser(description='Counts the number of tokens in the given files.')
@@ -67,12 +194,76 @@ def main():
                         default=[sys.stdin])
     parser.add_argument('--model', default=DEFAULT_MODEL,
                         help='the OpenAI model to use (default: {})'.format(DEFAULT_MODEL))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='the number of threads to encode on, 0 for one per CPU (default: 1)')
+    parser.add_argument('--jsonl', action='store_true',
+                        help='count the prompt tokens of each chat request record in JSON lines files')
+    parser.add_argument('--context-limit', type=int,
+                        help='with --jsonl, report records with more than this many prompt tokens')
+    parser.add_argument('--cache', action='store_true',
+                        help='remember token counts in an on-disk cache keyed by file content')
+    parser.add_argument('--cache-file',
+                        help='path to the cache database (default: {})'.format(openai_tokens_cache.default_cache_path(openai_tokens_cache.DEFAULT_CACHE_NAME)))
+    parser.add_argument('--cache-max-entries', type=int, default=openai_tokens_cache.DEFAULT_MAX_ENTRIES,
+                        help='the number of counts to keep in the cache (default: {})'.format(openai_tokens_cache.DEFAULT_MAX_ENTRIES))
+    parser.add_argument('--cache-refresh', action='store_true',
+                        help='encode every file and replace its cached count')
+    parser.add_argument('--cache-prune', action='store_true',
+                        help='evict old counts and forget deleted files, then exit')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='append timing and usage metrics to FILE, or write a Prometheus textfile if FILE ends in .prom')
     args = parser.parse_args()
 
+    if args.metrics:
+        openai_metrics.enable('openai-tokens-count')
+        try:
+            count(parser, args)
+        finally:
+            openai_metrics.write(args.metrics)
+    else:
+        count(parser, args)
+
+def count(parser, args):
+    """Counts and prints the tokens in the files given by the parsed command-line arguments."""
+
+    if args.jobs < 0:
+        parser.error('the number of jobs should be nonnegative')
+    if args.cache_max_entries < 1:
+        parser.error('the number of cache entries should be positive')
+    jobs = args.jobs or os.cpu_count() or 1
+
+    with openai_metrics.stage('tokenizer_setup'):
+        counter = openai_tokens_serve.connect_token_counter(args.model)
+
+    if args.jsonl:
+        with openai_metrics.stage('count'):
+            count_jsonl(args.files, counter, jobs, args.context_limit)
+        return
+
+    cache = None
+    if args.cache or args.cache_file or args.cache_refresh or args.cache_prune:
+        cache = openai_tokens_cache.TokenCountCache(args.cache_file, args.cache_max_entries, args.cache_refresh)
+
+    if args.cache_prune:
+        cache.prune()
+        cache.close()
+        return
+
+    try:
+        with openai_metrics.stage('count'):
+            if jobs > 1:
+                counts = openai_tokens.count_tokens_in_files(args.files, args.model, jobs, cache, counter)
+            else:
+                counts = [openai_tokens.count_tokens_in_file(file, args.model, cache, counter) for file in args.files]
+    finally:
+        if cache is not None:
+            cache.close()
+    openai_metrics.add('files', len(counts))
+    openai_metrics.add('tokens', sum(counts))
+
     total = 0
     results = []
-    for file in args.files:
-        num_tokens = openai_tokens.count_tokens_in_file(file, args.model)
+    for num_tokens, file in zip(counts, args.files):
         results.append((num_tokens, file.name))
         total += num_tokens
 
@@ -15,6 +15,10 @@ DESCRIPTION
     If no file is specified, or if the file is -, openai-tokens-head
     reads from standard input.
 
+    Input is read and encoded only until COUNT tokens are known, so
+    the time taken depends on COUNT rather than on the size of the
+    input, and an endless pipe can be truncated.
+
 OPTIONS
     -n, --tokens COUNT
         Output the first COUNT tokens. If COUNT is 0, output nothing.
@@ -23,6 +27,12 @@ OPTIONS
         Specifies the OpenAI model to use for tokenizing. Defaults to
         "gpt-4-0314".
     
+    --metrics FILE
+        Append the wall and CPU time spent loading the tokenizer and
+        reading the heads of the files, the characters read and the peak
+        memory use to FILE as one JSON line, or write them to FILE as a
+        Prometheus textfile if its name ends in .prom.
+
     file
         The text file to get tokens from. Multiple files can be
         specified. If no file is provided or if the file is '-',
@@ -35,6 +45,12 @@ EXAMPLES
     Output the first 50 tokens using a different model:
     openai-tokens-head --model "gpt-3.5-turbo-0301" -n 50 example.txt
 
+ENVIRONMENT
+    OPENAI_TOKENS_SOCKET
+        If an openai-tokens-serve server is listening on this socket
+        (see openai-tokens-serve for the default), tokens are encoded
+        through it instead of loading tiktoken in-process.
+
 AUTHORS
     Written by GPT-4.
     Prompt engineering by Eric Hammond.
@@ -46,7 +62,9 @@ DATE
 
 import argparse
 import sys
+from . import openai_metrics
 from . import openai_tokens
+from . import openai_tokens_serve
 
 # Constants
 DEFAULT_MODEL = "gpt-4-0314"
@@ -60,15 +78,31 @@ def main():
                         help='the number of tokens to output')
     parser.add_argument('--model', default=DEFAULT_MODEL,
                         help='the OpenAI model to use (default: {})'.format(DEFAULT_MODEL))
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='append timing and usage metrics to FILE, or write a Prometheus textfile if FILE ends in .prom')
     args = parser.parse_args()
 
     if args.tokens < 0:
         print("Error: the number of tokens to output should be nonnegative.")
         return
 
+    if args.metrics:
+        openai_metrics.enable('openai-tokens-head')
+        try:
+            head(args)
+        finally:
+            openai_metrics.write(args.metrics)
+    else:
+        head(args)
+
+def head(args):
+    """Prints the first tokens of each of the files given by the parsed command-line arguments."""
+    with openai_metrics.stage('tokenizer_setup'):
+        counter = openai_tokens_serve.connect_token_counter(args.model)
     for i, file in enumerate(args.files):
-        text = file.read()
-        head_text = openai_tokens.head_tokens_text(text, args.model, args.tokens)
+        with openai_metrics.stage('head'):
+            head_text = openai_tokens.head_tokens_in_file(file, args.model, args.tokens, counter)
+        openai_metrics.add('files')
         if len(args.files) > 1:
             if i != 0:
                 print()  # Add an extra newline between files
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+NAME
+    openai-tokens-serve - keep OpenAI tokenizers loaded and serve them
+    over a Unix domain socket
+
+SYNOPSIS
+    openai-tokens-serve [options]
+
+DESCRIPTION
+    openai-tokens-serve loads tiktoken encodings once and answers
+    encode, count and decode requests from openai-tokens-count,
+    openai-tokens-head and openai-tokens-split over a local Unix domain
+    socket, until it is interrupted.
+
+    While it is running, those tools send their text to it instead of
+    importing tiktoken and building the BPE tables themselves, so each
+    call costs about one socket round trip. When it is not running, they
+    encode in-process as before. The output is the same either way:
+    count, head and split are still worked out by the tools from the
+    tokens the server returns.
+
+    The socket path is $OPENAI_TOKENS_SOCKET if set, otherwise
+    openai-tokens.sock in $XDG_RUNTIME_DIR, otherwise
+    openai-tokens.sock in /tmp/openai-tokens-UID, a directory the server
+    creates readable only by its owner. Set OPENAI_TOKENS_SOCKET to an
+    empty string to stop the tools from using a server.
+
+    The tools only talk to a server run by the same user: they check the
+    owner of the socket and, where the system reports it, of the process
+    at the other end, and otherwise warn and encode in-process.
+
+PROTOCOL
+    Each request and response is one JSON object on one line. Requests
+    hold an "op" and a "model":
+
+    {"op": "encoding", "model": M}
+        Returns {"name": ENCODING_NAME}.
+
+    {"op": "encode", "model": M, "texts": [TEXT, ...]}
+        Returns {"tokens": [[TOKEN, ...], ...]}.
+
+    {"op": "count", "model": M, "texts": [TEXT, ...]}
+        Returns {"counts": [COUNT, ...]}.
+
+    {"op": "decode", "model": M, "tokens": [TOKEN, ...]}
+        Returns {"text": TEXT}.
+
+    Failures return {"error": MESSAGE, "type": EXCEPTION_NAME}.
+
+OPTIONS
+    --socket PATH
+        Listen on PATH instead of the default socket path.
+
+    --model MODEL_NAME
+        Load the encoding for MODEL_NAME at startup. May be given more
+        than once. Other models are loaded on first use.
+
+EXAMPLES
+    Start a server in the background, then count tokens through it:
+    openai-tokens-serve &
+    openai-tokens-count example.txt
+
+AUTHORS
+    Written by GPT-4.
+    Prompt engineering by Eric Hammond.
+
+DATE
+    2026-10-17
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+from . import openai_tokens
+
+# Define constants
+SOCKET_NAME = 'openai-tokens.sock'
+
+def private_socket_dir():
+    """Returns the directory in /tmp that holds the socket when $XDG_RUNTIME_DIR is not set."""
+    return f"/tmp/openai-tokens-{os.getuid()}"
+
+def default_socket_path():
+    """Returns the socket path from $OPENAI_TOKENS_SOCKET, $XDG_RUNTIME_DIR or a private directory in /tmp."""
+    path = os.getenv('OPENAI_TOKENS_SOCKET')
+    if path is not None:
+        return path
+    runtime_dir = os.getenv('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, SOCKET_NAME)
+    return os.path.join(private_socket_dir(), SOCKET_NAME)
+
+def make_private_dir(path):
+    """Creates directory path readable only by this user, or checks that it already is, raising PermissionError if not."""
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{path} is not a directory private to this user")
+
+class RemoteError(Exception):
+    """A request failed in the server."""
+
+class RemoteEncoding:
+    """Stands in for a tiktoken encoding, sending each call to an openai-tokens-serve server."""
+
+    def __init__(self, connection, model):
+        self.connection = connection
+        self.model = model
+        self.name = connection.request({"op": "encoding", "model": model})["name"]
+
+    def encode(self, text):
+        return self.connection.request({"op": "encode", "model": self.model, "texts": [text]})["tokens"][0]
+
+    def count_batch(self, texts):
+        return self.connection.request({"op": "count", "model": self.model, "texts": texts})["counts"]
+
+    def decode(self, tokens):
+        return self.connection.request({"op": "decode", "model": self.model, "tokens": tokens})["text"]
+
+class Connection:
+    """A connection to an openai-tokens-serve server, shared safely between threads."""
+
+    def __init__(self, path):
+        # Anyone who can bind the path would see all the text sent, so only this user's server is trusted
+        if os.stat(path).st_uid != os.getuid():
+            raise PermissionError(f"{path} belongs to another user")
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.connect(path)
+            self.check_peer(path)
+        except OSError:
+            self.socket.close()
+            raise
+        self.file = self.socket.makefile('rwb')
+        self.lock = threading.Lock()
+
+    def check_peer(self, path):
+        """Raises PermissionError if the server process runs as another user, where the system can tell."""
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return
+        credentials = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', credentials)
+        if uid != os.getuid():
+            raise PermissionError(f"the server on {path} runs as another user")
+
+    def request(self, request):
+        """Sends request and returns the server's response, raising ValueError or RemoteError on failure."""
+        with self.lock:
+            self.file.write(json.dumps(request).encode('utf-8') + b'\n')
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise RemoteError('openai-tokens-serve closed the connection')
+        response = json.loads(line)
+        if 'error' in response:
+            if response.get('type') == 'ValueError':
+                raise ValueError(response['error'])
+            raise RemoteError(f"{response.get('type')}: {response['error']}")
+        return response
+
+class RemoteTokenCounter(openai_tokens.TokenCounter):
+    """A TokenCounter that encodes through an openai-tokens-serve server, batching requests where it can."""
+
+    def __init__(self, connection, model):
+        super().__init__(model, RemoteEncoding(connection, model))
+
+    def count(self, text):
+        return self.encoding.count_batch([text])[0]
+
+    def count_many(self, texts, num_threads=openai_tokens.DEFAULT_NUM_THREADS):
+        return self.encoding.count_batch(list(texts))
+
+    def count_messages(self, messages):
+        return self.count_messages_many([messages])[0]
+
+    def count_files(self, files, jobs):
+        # Send up to jobs chunks per request; the server encodes them on its own threads
+        counts = [0] * len(files)
+        batch = []
+        for i, file in enumerate(files):
+            for chunk in openai_tokens.iter_text_chunks(file):
+                batch.append((i, chunk))
+                if len(batch) >= jobs:
+                    for (index, _), num_tokens in zip(batch, self.count_many([chunk for _, chunk in batch])):
+                        counts[index] += num_tokens
+                    batch = []
+        for (index, _), num_tokens in zip(batch, self.count_many([chunk for _, chunk in batch])):
+            counts[index] += num_tokens
+        return counts
+
+def connect_token_counter(model, path=None):
+    """Returns a RemoteTokenCounter for model if a server is listening on path, otherwise the shared in-process TokenCounter."""
+    path = default_socket_path() if path is None else path
+    if path:
+        try:
+            return RemoteTokenCounter(Connection(path), model)
+        except PermissionError as e:
+            print(f"Warning: not using openai-tokens-serve: {e}", file=sys.stderr)
+        except OSError:
+            pass
+    return openai_tokens.get_token_counter(model)
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Answers JSON line requests on one connection until the client closes it."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.respond(json.loads(line))
+            except Exception as e:
+                response = {"error": str(e), "type": type(e).__name__}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+    def respond(self, request):
+        counter = openai_tokens.get_token_counter(request["model"])
+        op = request["op"]
+        if op == "encoding":
+            return {"name": counter.encoding.name}
+        elif op == "encode":
+            return {"tokens": [counter.encoding.encode(text) for text in request["texts"]]}
+        elif op == "count":
+            return {"counts": counter.count_many(request["texts"])}
+        elif op == "decode":
+            return {"text": counter.encoding.decode(request["tokens"])}
+        raise ValueError(f"unknown op {op!r}")
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def signal_handler(signal, frame):
+    sys.exit(0)
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves OpenAI tokenizers over a Unix domain socket.')
+    parser.add_argument('--socket', default=default_socket_path(),
+                        help='the socket path to listen on (default: {})'.format(default_socket_path()))
+    parser.add_argument('--model', action='append', default=[],
+                        help='a model to load at startup; may be given more than once')
+    args = parser.parse_args()
+
+    if not args.socket:
+        parser.error('the socket path should not be empty')
+    if os.path.dirname(args.socket) == private_socket_dir():
+        try:
+            make_private_dir(private_socket_dir())
+        except OSError as e:
+            parser.error(str(e))
+
+    # Refuse to replace a running server, but clean up after a dead one
+    if os.path.exists(args.socket):
+        try:
+            Connection(args.socket).socket.close()
+        except OSError:
+            os.remove(args.socket)
+        else:
+            parser.error(f"a server is already listening on {args.socket}")
+
+    for model in args.model:
+        openai_tokens.get_token_counter(model)
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    server = Server(args.socket, RequestHandler)
+    try:
+        os.chmod(args.socket, 0o600)
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+NAME
+    openai-tokens-split - split the input file(s) or stdin into windows
+    of `--tokens COUNT` tokens
+
+SYNOPSIS
+    openai-tokens-split [options] file...
+
+DESCRIPTION
+    openai-tokens-split reads the specified text files and splits them
+    into consecutive windows of `--tokens COUNT` tokens according to the
+    OpenAI model's specifications. The last window of each file may be
+    shorter. With `--overlap OVERLAP`, each window starts with the last
+    OVERLAP tokens of the window before it.
+
+    Each window is written to its own file, named PREFIX followed by a
+    four digit sequence number starting at 0000 and then SUFFIX. After
+    8999 the numbers grow two digits at a time, as split(1)'s do, going
+    on from 900000 to 989999, then from 99000000, and so on, so that
+    the file names always sort in window order. With `--jsonl`, windows
+    are instead written to standard output as JSON lines records giving
+    the input file name, the window's sequence number, its start and
+    end token offsets in the input file, and its text.
+
+    Each input is read and encoded once, one chunk at a time, so the
+    time taken grows linearly with the size of the input and memory use
+    does not.
+
+    If no file is specified, or if the file is -, openai-tokens-split
+    reads from standard input.
+
+OPTIONS
+    -n, --tokens COUNT
+        Put COUNT tokens in each window.
+
+    --overlap OVERLAP
+        Repeat the last OVERLAP tokens of each window at the start of
+        the next. Must be less than COUNT. Defaults to 0.
+
+    --model MODEL_NAME
+        Specifies the OpenAI model to use for tokenizing. Defaults to
+        "gpt-4-0314".
+
+    --prefix PREFIX
+        Start the name of each window file with PREFIX. Defaults to
+        "x".
+
+    --suffix SUFFIX
+        End the name of each window file with SUFFIX, for example
+        ".txt". Defaults to no suffix.
+
+    --jsonl
+        Write windows to standard output as JSON lines instead of to
+        files.
+
+    file
+        The text file to split. Multiple files can be specified;
+        sequence numbers continue from one file to the next. If no file
+        is provided or if the file is '-', openai-tokens-split reads
+        from standard input.
+
+EXAMPLES
+    Split a document into 1000 token files named part0000.txt, part0001.txt, ...:
+    openai-tokens-split -n 1000 --prefix part --suffix .txt document.txt
+
+    Split with 100 tokens of overlap into JSON lines records:
+    openai-tokens-split -n 1000 --overlap 100 --jsonl document.txt > windows.jsonl
+
+ENVIRONMENT
+    OPENAI_TOKENS_SOCKET
+        If an openai-tokens-serve server is listening on this socket
+        (see openai-tokens-serve for the default), tokens are encoded
+        through it instead of loading tiktoken in-process.
+
+AUTHORS
+    Written by GPT-4.
+    Prompt engineering by Eric Hammond.
+    Some code Copyright (c) 2023 OpenAI
+
+DATE
+    2026-10-17
+"""
+
+import argparse
+import json
+import sys
+from . import openai_tokens
+from . import openai_tokens_serve
+
+# Constants
+DEFAULT_MODEL = "gpt-4-0314"
+DEFAULT_PREFIX = "x"
+SEQUENCE_DIGITS = 4
+
+def sequence_number(index, digits=SEQUENCE_DIGITS):
+    """Returns the sequence number of window index as text that sorts in window order, however many windows there are."""
+    # Numbers starting with 9 are kept for the longer ones, each 9 also adding a digit after it
+    nines = ''
+    while index >= 9 * 10 ** (digits - 1):
+        index -= 9 * 10 ** (digits - 1)
+        nines += '9'
+        digits += 1
+    return f"{nines}{index:0{digits}d}"
+
+def main():
+    parser = argparse.ArgumentParser(description='Splits the given files into windows of COUNT tokens.')
+    parser.add_argument('files', metavar='F', type=argparse.FileType('r'), nargs='*',
+                        help='a file to split',
+                        default=[sys.stdin])
+    parser.add_argument('-n', '--tokens', type=int, required=True,
+                        help='the number of tokens in each window')
+    parser.add_argument('--overlap', type=int, default=0,
+                        help='the number of tokens each window repeats from the one before (default: 0)')
+    parser.add_argument('--model', default=DEFAULT_MODEL,
+                        help='the OpenAI model to use (default: {})'.format(DEFAULT_MODEL))
+    parser.add_argument('--prefix', default=DEFAULT_PREFIX,
+                        help='the start of each window file name (default: {})'.format(DEFAULT_PREFIX))
+    parser.add_argument('--suffix', default='',
+                        help='the end of each window file name (default: none)')
+    parser.add_argument('--jsonl', action='store_true',
+                        help='write windows to standard output as JSON lines')
+    args = parser.parse_args()
+
+    if args.tokens <= 0:
+        parser.error('the number of tokens in each window should be positive')
+    if not 0 <= args.overlap < args.tokens:
+        parser.error('the overlap should be nonnegative and less than the number of tokens in each window')
+
+    counter = openai_tokens_serve.connect_token_counter(args.model)
+    index = 0
+    for file in args.files:
+        for start, end, text in openai_tokens.split_tokens_in_file(file, args.model, args.tokens, args.overlap, counter):
+            if args.jsonl:
+                record = {"file": file.name, "index": index, "start": start, "end": end, "text": text}
+                print(json.dumps(record, ensure_ascii=False))
+            else:
+                with open(f"{args.prefix}{sequence_number(index)}{args.suffix}", 'w') as output:
+                    output.write(text)
+            index += 1
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,31 @@ DESCRIPTION
     openai-transcribe reads the specified audio and/or video files and
     transcribes them using OpenAI's Whisper API.
 
-    The transcribed text is then printed to standard output.
+    Each file is probed once with ffprobe. Its audio is then sent in
+    chunks, which ffmpeg cuts straight from the source file and encodes
+    in a compact format suited to speech: mono, 16 kHz MP3 at 32 kbit/s,
+    which is what Whisper works from anyway. Audio already in that
+    format is copied without being encoded again. Video is never
+    decoded, and the whole recording is never decoded into memory, so
+    memory use does not grow with its length.
+
+    Each chunk can be as long as the API's upload size limit allows,
+    about 100 minutes of compact audio. Recordings longer than that are
+    split into the fewest chunks that fit, of about equal length, each
+    cut in the middle of the latest pause in the 30 seconds before its
+    even share, found with ffmpeg's silencedetect filter, so that no
+    word is split between two chunks.
+
+    Files are worked on as a pipeline: while the chunks of one file
+    upload, the next files are probed and planned and their chunks
+    exported, on one thread per CPU. Only a few exported chunks wait for
+    upload at any time, and they are held in memory up to a limit, so
+    memory and temporary disk use stay small however many files are
+    given, and in most runs nothing is written to disk at all.
+
+    The transcribed text is then printed to standard output, in the
+    order the files were given. If any file or chunk could not be
+    transcribed, the others are still printed and the exit status is 1.
 
 OPTIONS
     --config CONFIGFILE
@@ -21,7 +45,68 @@ OPTIONS
         Name of the project configuration to use from the config file.
 
     --verbose
-        Print progress before each major external step.
+        Print progress before each major external step, and the number
+        of bytes of audio uploaded for each file next to the size of
+        its original audio.
+
+    -j, --jobs N
+        Upload up to N chunks at once. The transcripts are still written
+        in order, each one as soon as the chunks before it are done.
+        Default is 1.
+
+    --prefetch N
+        Prepare up to N files beyond the one being transcribed. Default
+        is 2.
+
+    --memory-limit MB
+        Hold exported chunks in memory, and upload them from there, up
+        to MB megabytes in all. Chunks beyond that are written to files
+        in a single scratch directory, which is removed at exit. 0 means
+        always use scratch files. Default is 256.
+
+    --scratch-dir DIR
+        Make the scratch directory in DIR. Default is $TMPDIR or /tmp.
+
+    --max-retries N
+        Retry chunks that fail with a rate limit (429) or server (5xx)
+        error, a timeout or a dropped connection up to N times, waiting
+        longer after each failure. Default is 5.
+
+    --cache
+        Keep the transcript of every chunk in an on-disk cache, keyed by
+        a hash of the chunk's audio and the API parameters, along with
+        a manifest of each file's chunks, keyed by its path, size and
+        modification time. Rerunning on a file skips the chunks already
+        transcribed, so an interrupted or failed run resumes where it
+        left off, and a file transcribed before costs no API calls.
+
+    --no-cache
+        Do not use the cache, even if the project configuration
+        enables it.
+
+    --refresh, --cache-refresh
+        Transcribe every chunk again and replace its cached transcript.
+
+    --cache-file CACHE_FILE
+        Path to the cache database. Default is
+        $XDG_CACHE_HOME/openai-misc-tools/transcripts.sqlite, or
+        ~/.cache/openai-misc-tools/transcripts.sqlite.
+
+    --cache-max-entries N
+        The number of chunk transcripts, and of file manifests, to keep
+        in the cache, evicting the least recently used beyond that.
+        Default is 10000.
+
+    --metrics FILE
+        Record the wall and CPU time of each stage (reading the
+        configuration, importing openai, probing, finding pauses,
+        exporting chunks, the cache and uploads), counting ffmpeg's CPU
+        time, along with the bytes of input ffmpeg reads to find pauses
+        and export chunks (each chunk counting its share of the file),
+        the bytes of original audio and the bytes uploaded in its place,
+        the seconds of audio, cache hits, retries and peak memory use.
+        Append them to FILE as one JSON line, or write them to FILE as a
+        Prometheus textfile if its name ends in .prom.
 
     file
         The audio or video file to transcribe. Multiple files can be
@@ -40,10 +125,22 @@ CONFIGURATION
     file. However, the --config option will override both the default
     and the environment variable.
 
+    A project section may set 'api_base' to send requests to an
+    OpenAI-compatible endpoint other than api.openai.com.
+
+    Setting 'cache = true' in a project section turns on the transcript
+    cache for that project as if --cache were given.
+
+    A project section may set 'requests_per_minute' to keep every
+    openai-transcribe and openai-chat process on the host that uses its
+    API key under that limit. Chunks wait locally for their turn
+    instead of failing with rate limit errors.
+
     Example configuration file:
     [MyProject]
     org_id = org-OPENAI_OR_GID
     api_key = sk-OPENAI_API_KEY
+    requests_per_minute = 50
 
 EXAMPLES
     Transcribe a single video:
@@ -52,6 +149,13 @@ EXAMPLES
     Transcribe multiple files with verbose output:
     openai-transcribe --verbose chapter1.mp3 chapter2.mp3 chapter3.mp3 > book.txt
 
+    Transcribe a long recording, uploading four chunks at a time:
+    openai-transcribe --jobs 4 three-hour-interview.mp3 > interview.txt
+
+    Transcribe a batch of recordings, resuming after a failure without
+    paying again for the chunks already done:
+    openai-transcribe --cache recordings/*.mp4 > transcripts.txt
+
 AUTHORS
     Written by GPT-4.
     Prompt engineering by Eric Hammond.
@@ -61,24 +165,40 @@ DATE
 """
 
 import argparse
+import collections
+import concurrent.futures
 import configparser
+import io
+import itertools
+import json
 import os
 import sys
 import signal
 import subprocess
-from pydub import AudioSegment
-import openai
 import tempfile
+import threading
 import shutil
-from moviepy.editor import VideoFileClip
 import atexit
+from . import openai_metrics
+from . import openai_rate_limit
+from . import openai_retry
+from . import openai_transcribe_cache
+from . import openai_transcribe_plan
+
+# The openai package is slow to import, so it is imported only where
+# it is used
 
 # Define constants
 DEFAULT_CONFIG_FILE = '~/.openai.conf'
 DEFAULT_PROJECT = 'default'
-CHUNK_SIZE_IN_MIN = 10
-CHUNK_SIZE_IN_MS = CHUNK_SIZE_IN_MIN * 60 * 1000
+COMPACT_CHANNELS = 1
+COMPACT_SAMPLE_RATE = 16000
+COMPACT_BIT_RATE = 32000
 WHISPER_MODE = 'whisper-1'
+TRANSCRIBE_PARAMS = {'model': WHISPER_MODE}
+DEFAULT_PREFETCH_FILES = 2
+DEFAULT_MEMORY_LIMIT_MB = 256
+DEFAULT_MEMORY_LIMIT = DEFAULT_MEMORY_LIMIT_MB * 1000 * 1000
 
 # Define signal handling function
 def signal_handler(signal, frame):
@@ -86,11 +206,20 @@ def signal_handler(signal, frame):
     sys.exit(0)
 
 def check_ffmpeg_installed():
-    try:
-        subprocess.check_output(['ffmpeg', '-version'])
-    except FileNotFoundError:
-        print("ffmpeg not found. Please install it before running this script.", file=sys.stderr)
-        sys.exit(1)
+    for program in ('ffmpeg', 'ffprobe'):
+        try:
+            subprocess.check_output([program, '-version'])
+        except FileNotFoundError:
+            print(f"{program} not found. Please install ffmpeg before running this script.", file=sys.stderr)
+            sys.exit(1)
+
+def run_command(command, text=True):
+    """Runs command and returns its output, as bytes unless text is true, raising RuntimeError with its error output if it fails."""
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=text)
+    if result.returncode != 0:
+        error = result.stderr if text else result.stderr.decode('utf-8', 'replace')
+        raise RuntimeError(error.strip() or f"{command[0]} exited with status {result.returncode}")
+    return result.stdout
 
 def safe_remove(file_path):
     try:
@@ -98,73 +227,407 @@ def safe_remove(file_path):
     except FileNotFoundError:
         pass
 
-def convert_video_to_audio(filename):
-    try:
-        handle, output_filename = tempfile.mkstemp(suffix=".mp3")
-        os.close(handle)  # We don't need the open file handle
-        atexit.register(safe_remove, output_filename)
-        subprocess.run(['ffmpeg', '-i', filename, '-y', '-vn', '-acodec', 'libmp3lame', '-loglevel', 'error', output_filename])
-    except Exception as e:
-        print(f"Error while converting '{filename}' to audio: {e}", file=sys.stderr)
-        return None
-    return output_filename
-
-def transcribe_audio(filename, verbose):
-    try:
-        audio = AudioSegment.from_mp3(filename)
-    except Exception as e:
-        print(f"Error while reading audio from '{filename}': {e}", file=sys.stderr)
+def probe_media(filename):
+    """Returns ffprobe's description of the format and streams of a media file."""
+    return json.loads(run_command(['ffprobe', '-v', 'error', '-show_format', '-show_streams', '-of', 'json', filename]))
+
+def audio_stream(media):
+    """Returns the first audio stream of a probed media file, or None if it has none."""
+    return next((stream for stream in media.get('streams', []) if stream.get('codec_type') == 'audio'), None)
+
+def audio_bytes(media):
+    """Returns the estimated size in bytes of the audio in a probed media file as it is, or None if unknown."""
+    stream = audio_stream(media)
+    duration = float(media['format'].get('duration', 0))
+    bit_rate = stream.get('bit_rate') if stream else None
+    if bit_rate is None and all(other.get('codec_type') != 'video' for other in media.get('streams', [])):
+        bit_rate = media['format'].get('bit_rate')  # an audio file is all audio
+    if bit_rate is None or not str(bit_rate).isdigit():
         return None
-    chunks = [audio[i:i + CHUNK_SIZE_IN_MS] for i in range(0, len(audio), CHUNK_SIZE_IN_MS)]
-
-    transcripts = []
-    for i, chunk in enumerate(chunks):
+    return int(int(bit_rate) * duration / 8)
+
+def is_compact(media):
+    """Returns whether a probed media file is an MP3 file already in the compact upload format."""
+    stream = audio_stream(media)
+    return (media['format'].get('format_name') == 'mp3' and len(media.get('streams', [])) == 1
+            and stream.get('codec_name') == 'mp3' and stream.get('channels') == COMPACT_CHANNELS
+            and int(stream.get('sample_rate', 0)) <= COMPACT_SAMPLE_RATE
+            and int(stream.get('bit_rate') or 0) <= COMPACT_BIT_RATE)
+
+def upload_bytes_per_second(media):
+    """Returns the number of bytes per second of the chunks uploaded for a probed media file."""
+    bit_rate = int(audio_stream(media).get('bit_rate') or COMPACT_BIT_RATE) if is_compact(media) else COMPACT_BIT_RATE
+    return bit_rate / 8
+
+def export_chunk(filename, start, length, chunk_filename=None, copy=False):
+    """Writes length seconds of the audio in filename, from start seconds on, to chunk_filename as compact MP3.
+
+    If chunk_filename is None, the chunk is returned as bytes instead.
+    If length is None, the chunk runs to the end of the audio. If copy
+    is true, the audio is already compact MP3 and is copied rather than
+    encoded again.
+    """
+    if copy:
+        codec = ['-c:a', 'copy']
+    else:
+        codec = ['-ac', str(COMPACT_CHANNELS), '-ar', str(COMPACT_SAMPLE_RATE),
+                 '-c:a', 'libmp3lame', '-b:a', str(COMPACT_BIT_RATE)]
+    # Seeking before -i skips straight to start instead of decoding up to it
+    limit = ['-t', str(length)] if length is not None else []
+    return run_command(['ffmpeg', '-loglevel', 'error', '-y', '-ss', str(start), '-i', filename, *limit,
+                        '-map', '0:a:0', *codec, '-f', 'mp3', chunk_filename or 'pipe:1'], text=False)
+
+class ChunkStore:
+    """Exported chunks, held in memory up to memory_limit bytes in all and in files in one scratch directory beyond that."""
+
+    def __init__(self, memory_limit=DEFAULT_MEMORY_LIMIT, scratch_dir=None):
+        self.memory_limit = memory_limit
+        self.scratch_parent = scratch_dir
+        self.scratch_dir = None
+        self.in_memory = 0
+        self.sizes = {}
+        self.names = itertools.count()
+        self.lock = threading.Lock()
+
+    def _scratch_path(self, name):
+        with self.lock:
+            if self.scratch_dir is None:
+                # One directory for the whole run, removed with everything in it at exit
+                self.scratch_dir = tempfile.mkdtemp(prefix='openai-transcribe-', dir=self.scratch_parent)
+                atexit.register(shutil.rmtree, self.scratch_dir, True)
+        return os.path.join(self.scratch_dir, name)
+
+    def export(self, filename, start, length, copy, estimate):
+        """Exports a chunk expected to take about estimate bytes, returning it as a named binary file open for reading."""
+        name = f"chunk-{next(self.names)}.mp3"
+        with self.lock:
+            in_memory = self.in_memory + estimate <= self.memory_limit
+            if in_memory:
+                self.in_memory += estimate
+        if not in_memory:
+            openai_metrics.add('chunks_spilled')
+            chunk_filename = self._scratch_path(name)
+            try:
+                export_chunk(filename, start, length, chunk_filename, copy)
+                return open(chunk_filename, 'rb')
+            except BaseException:
+                safe_remove(chunk_filename)
+                raise
+        try:
+            data = export_chunk(filename, start, length, None, copy)
+        except BaseException:
+            with self.lock:
+                self.in_memory -= estimate
+            raise
+        chunk = io.BytesIO(data)
+        chunk.name = name  # the API tells the format from the name
+        with self.lock:
+            self.in_memory += len(data) - estimate
+            self.sizes[id(chunk)] = len(data)
+        return chunk
+
+    def release(self, chunk):
+        """Frees the memory or scratch file used by an exported chunk."""
+        chunk.close()
+        if isinstance(chunk, io.BytesIO):
+            with self.lock:
+                self.in_memory -= self.sizes.pop(id(chunk))
+        else:
+            safe_remove(chunk.name)
+
+    def close(self):
+        """Removes the scratch directory, if one was made."""
+        if self.scratch_dir is not None:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+            self.scratch_dir = None
+
+def planning_params():
+    """Returns the parameters that decide how a file is cut into chunks and what is sent for them."""
+    return dict(TRANSCRIBE_PARAMS, channels=COMPACT_CHANNELS, sample_rate=COMPACT_SAMPLE_RATE, bit_rate=COMPACT_BIT_RATE,
+                plan_version=openai_transcribe_plan.PLAN_VERSION, max_chunk_bytes=openai_transcribe_plan.MAX_CHUNK_BYTES,
+                silence_window=openai_transcribe_plan.SILENCE_WINDOW, silence_noise=openai_transcribe_plan.SILENCE_NOISE, silence_duration=openai_transcribe_plan.SILENCE_DURATION)
+
+def plan_audio(filename, media, verbose):
+    """Returns the chunks to cut the audio in a probed media file into, as a list of [start, length, None] manifest entries."""
+    duration = float(media['format']['duration'])
+    bytes_per_second = upload_bytes_per_second(media)
+
+    # Pauses are only worth looking for if there is more than one chunk
+    silences = []
+    if duration * bytes_per_second > openai_transcribe_plan.MAX_CHUNK_BYTES:
         if verbose:
-            print(f"Converting audio to text: Chunk {i+1} out of {len(chunks)}", file=sys.stderr)
-        handle, chunk_filename = tempfile.mkstemp(suffix=".mp3")
-        os.close(handle)  # We don't need the open file handle
-        atexit.register(safe_remove, chunk_filename)
+            print(f"Finding pauses to cut '{filename}' at", file=sys.stderr)
         try:
-            chunk.export(chunk_filename, format="mp3")
-            with open(chunk_filename, "rb") as audio_file:
-                transcript = openai.Audio.transcribe(WHISPER_MODE, audio_file)
-                transcripts.append(transcript["text"])
+            with openai_metrics.stage('silence_detect'):
+                silences = openai_transcribe_plan.detect_silences(filename, duration)
+            if os.path.isfile(filename):
+                openai_metrics.add('bytes_read', os.path.getsize(filename))
         except Exception as e:
-            print(f"Error while transcribing chunk {i} from '{filename}': {e}", file=sys.stderr)
+            print(f"Warning: cutting '{filename}' without looking for pauses: {e}", file=sys.stderr)
+    return [[start, length, None] for start, length in openai_transcribe_plan.plan_chunks(duration, bytes_per_second, silences)]
+
+class PreparedFile:
+    """A probed and planned input file, with a future for each of its chunks."""
+
+    def __init__(self, filename, media, params, manifest):
+        self.filename = filename
+        self.media = media
+        self.params = params
+        self.manifest = manifest
+        self.futures = []
+        self.failed = 0
+
+class TranscriptionPipeline:
+    """Prepares files and exports their chunks on one thread pool while another uploads the chunks already exported.
+
+    Probing, planning and exporting run up to prepare_jobs at a time, and
+    uploads up to jobs at a time. Each exported chunk holds one of a
+    fixed number of slots until it is uploaded, so exporting never runs
+    more than a few chunks ahead of the uploads, however many files are
+    queued.
+    """
+
+    def __init__(self, verbose, limiter=None, jobs=1, max_retries=openai_retry.DEFAULT_MAX_RETRIES, cache=None,
+                 prepare_jobs=None, chunks=None):
+        self.verbose = verbose
+        self.chunks = chunks or ChunkStore()
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.cache = cache
+        prepare_jobs = prepare_jobs or os.cpu_count() or 1
+        self.preparer = concurrent.futures.ThreadPoolExecutor(max_workers=prepare_jobs)
+        self.uploader = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        self.slots = threading.BoundedSemaphore(jobs + prepare_jobs)
+        self.stopped = threading.Event()
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def _submit(self, executor, function, *args):
+        future = executor.submit(function, *args)
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.pending.discard(future)
+
+    def close(self, cancel=False):
+        """Waits for the work in progress to finish, first stopping all work not yet started if cancel is true.
+
+        Once cancelled, no new export or upload is started, but an upload
+        already sent to the API still runs to its end.
+        """
+        if cancel:
+            self.stopped.set()
+            with self.lock:
+                pending = list(self.pending)
+            for future in pending:
+                future.cancel()
+        # Uploads go first, as cancelling them frees the slots that exports may be waiting for
+        self.uploader.shutdown(cancel_futures=cancel)
+        self.preparer.shutdown(cancel_futures=cancel)
+        self.chunks.close()
+
+    def start(self, filename):
+        """Starts preparing filename, returning a future of its PreparedFile, or of None if it cannot be read."""
+        return self._submit(self.preparer, self._prepare, filename)
+
+    def _prepare(self, filename):
+        if self.stopped.is_set():
+            return None
+        try:
+            with openai_metrics.stage('probe'):
+                media = probe_media(filename)
+        except Exception as e:
+            print(f"Error while reading '{filename}': {e}", file=sys.stderr)
+            return None
+        if audio_stream(media) is None or 'duration' not in media['format']:
+            print(f"Error while reading audio from '{filename}': no audio found", file=sys.stderr)
+            return None
+        openai_metrics.add('audio_seconds', float(media['format']['duration']))
+
+        # A manifest from an earlier run of the same file gives its chunks and those already transcribed
+        cache = self.cache if os.path.isfile(filename) else None
+        params = planning_params()
+        manifest = cache.lookup_manifest(filename, params) if cache is not None else None
+        if manifest is None:
+            if self.verbose:
+                print(f"Generating chunks of audio from '{filename}'", file=sys.stderr)
+            manifest = plan_audio(filename, media, self.verbose)
+            if cache is not None:
+                cache.store_manifest(filename, params, manifest)
+        elif self.verbose:
+            done = sum(1 for _, _, key in manifest if key is not None)
+            print(f"Resuming '{filename}': {done} of {len(manifest)} chunks already transcribed", file=sys.stderr)
+
+        prepared = PreparedFile(filename, media, params, manifest)
+        copy = is_compact(media)
+        bytes_per_second = upload_bytes_per_second(media)
+        # Only the chunks exported are read, each about its share of the file
+        duration = float(media['format']['duration'])
+        input_bytes_per_second = os.path.getsize(filename) / duration if os.path.isfile(filename) and duration > 0 else 0
+        for i, (start, length, key) in enumerate(manifest):
+            text = cache.lookup(key) if cache is not None and key is not None else None
+            if text is not None:
+                openai_metrics.add('cache_hits')
+                prepared.futures.append(concurrent.futures.Future())
+                prepared.futures[-1].set_result((text, 0, key))
+            else:
+                # The last chunk runs to the end, however far off the probed duration is
+                prepared.futures.append(self._submit(self.preparer, self._export, filename, start,
+                                                     length if i < len(manifest) - 1 else None, copy,
+                                                     int(length * bytes_per_second), int(length * input_bytes_per_second),
+                                                     i, len(manifest), cache))
+        return prepared
+
+    def _export(self, filename, start, length, copy, estimate, input_bytes, number, count, cache):
+        """Exports a chunk, returning its cached result or a future of its upload, or None on error."""
+        if self.stopped.is_set():
+            return None
+        self.slots.acquire()
+        chunk = None
+        uploading = False
+        try:
+            if self.stopped.is_set():
+                return None
+            if self.verbose:
+                print(f"Converting audio to text: Chunk {number+1} out of {count} of '{filename}'", file=sys.stderr)
+            with openai_metrics.stage('export'):
+                openai_metrics.add('bytes_read', input_bytes)
+                chunk = self.chunks.export(filename, start, length, copy, estimate)
+            key = None
+            if cache is not None:
+                # The same audio may have been transcribed before, from this file or another
+                with openai_metrics.stage('cache'):
+                    key = openai_transcribe_cache.audio_key(chunk.read(), TRANSCRIBE_PARAMS)
+                    text = cache.lookup(key)
+                if text is not None:
+                    openai_metrics.add('cache_hits')
+                    return text, 0, key
+            future = self._submit(self.uploader, self._upload, filename, chunk, number, key, cache)
+            uploading = True
+            # An upload cancelled before it starts never reaches its own cleanup
+            future.add_done_callback(lambda future: future.cancelled() and self._release(chunk))
+            return future
+        except Exception as e:
+            if not self.stopped.is_set():  # once stopped, the uploader refuses new work
+                print(f"Error while transcribing chunk {number} from '{filename}': {e}", file=sys.stderr)
+            return None
         finally:
-            safe_remove(chunk_filename)
-    return transcripts
+            if not uploading:
+                if chunk is not None:
+                    self.chunks.release(chunk)
+                self.slots.release()
+
+    def _release(self, chunk):
+        self.chunks.release(chunk)
+        self.slots.release()
+
+    def _upload(self, filename, chunk, number, key, cache):
+        """Uploads an exported chunk and returns its transcript, the bytes uploaded and its cache key, or None on error."""
+        if self.stopped.is_set():
+            self._release(chunk)
+            return None
+        import openai
+        size = chunk.seek(0, io.SEEK_END)
+
+        def upload():
+            if self.stopped.is_set():
+                raise concurrent.futures.CancelledError()  # not retried, so nothing more is paid for
+            chunk.seek(0)  # a retry sends the whole chunk again
+            if self.limiter is not None:
+                self.limiter.acquire()
+            openai_metrics.add('api_requests')
+            openai_metrics.add('bytes_uploaded', size)
+            return openai.Audio.transcribe(file=chunk, **TRANSCRIBE_PARAMS)
+
+        def report_retry(error, attempt, delay):
+            if self.verbose:
+                print(f"Retrying chunk {number+1} of '{filename}' in {delay:.1f}s after: {error}", file=sys.stderr)
 
-def is_video(file_path):
+        try:
+            with openai_metrics.stage('upload'):
+                transcript = openai_retry.call_with_retries(upload, max_retries=self.max_retries, on_retry=report_retry)
+            if cache is not None:
+                # Stored at once, so an interrupted run keeps every chunk it paid for
+                with openai_metrics.stage('cache'):
+                    cache.store(key, transcript["text"])
+            return transcript["text"], size, key
+        except Exception as e:
+            if not self.stopped.is_set():
+                print(f"Error while transcribing chunk {number} from '{filename}': {e}", file=sys.stderr)
+            return None
+        finally:
+            self._release(chunk)
+
+    def transcripts(self, prepared):
+        """Yields the transcripts of the chunks of a PreparedFile in order, as soon as each one and those before it are done."""
+        original_bytes = audio_bytes(prepared.media)
+        if original_bytes is not None:
+            openai_metrics.add('original_audio_bytes', original_bytes)
+        uploaded_bytes = 0
+        for i, future in enumerate(prepared.futures):
+            result = future.result()
+            if isinstance(result, concurrent.futures.Future):
+                result = result.result()
+            if result is None:
+                prepared.failed += 1
+            else:
+                transcript, chunk_bytes, key = result
+                uploaded_bytes += chunk_bytes
+                if self.cache is not None and prepared.manifest[i][2] != key:
+                    prepared.manifest[i][2] = key
+                    self.cache.store_manifest(prepared.filename, prepared.params, prepared.manifest)
+                yield transcript
+        if self.verbose:
+            original = f"{original_bytes} bytes" if original_bytes is not None else "an unknown number of bytes"
+            print(f"Uploaded {uploaded_bytes} bytes of audio from '{prepared.filename}' in place of {original}",
+                  file=sys.stderr)
+
+def handle_files(file_paths, verbose, limiter=None, jobs=1, max_retries=openai_retry.DEFAULT_MAX_RETRIES, cache=None,
+                 prefetch=DEFAULT_PREFETCH_FILES, chunks=None):
+    """Transcribes file_paths through a TranscriptionPipeline, printing the transcripts in order.
+
+    Returns whether every file and chunk was transcribed.
+    """
+    pipeline = TranscriptionPipeline(verbose, limiter, jobs, max_retries, cache, chunks=chunks)
+    finished = False
+    succeeded = True
     try:
-        clip = VideoFileClip(file_path)
-        return True
-    except Exception:
-        return False
-
-def handle_files(file_paths, verbose):
-    for i, file_path in enumerate(file_paths):
-        if verbose:
-            print(f"Processing file {i+1} out of {len(file_paths)}: {file_path}", file=sys.stderr)
-        if len(file_paths) > 1:
-            print(f"\n==> {file_path} <==")
-        if is_video(file_path):
+        # Later files are probed, planned and exported while the chunks of earlier ones upload
+        started = collections.deque()
+        upcoming = iter(file_paths)
+        for i, file_path in enumerate(file_paths):
+            while len(started) <= prefetch:
+                next_path = next(upcoming, None)
+                if next_path is None:
+                    break
+                started.append(pipeline.start(next_path))
             if verbose:
-                print("Converting video to audio", file=sys.stderr)
-            audio_file = convert_video_to_audio(file_path)
-            if audio_file is not None:
-                if verbose:
-                    print("Generating chunks of audio", file=sys.stderr)
-                transcripts = transcribe_audio(audio_file, verbose)
-                for transcript in transcripts:  # print the transcripts
-                    print(transcript)
-                safe_remove(audio_file)
-        else:
-            if verbose:
-                print("Generating chunks of audio", file=sys.stderr)
-            transcripts = transcribe_audio(file_path, verbose)
-            for transcript in transcripts:  # print the transcripts
-                print(transcript)
+                print(f"Processing file {i+1} out of {len(file_paths)}: {file_path}", file=sys.stderr)
+            if len(file_paths) > 1:
+                print(f"\n==> {file_path} <==", flush=True)
+            prepared = started.popleft().result()
+            if prepared is None:
+                succeeded = False
+                continue
+            for transcript in pipeline.transcripts(prepared):  # print each transcript as soon as it is ready
+                print(transcript, flush=True)
+            if prepared.failed:
+                succeeded = False
+        finished = True
+    finally:
+        pipeline.close(cancel=not finished)
+    return succeeded
+
+def open_transcript_cache(args, project_config):
+    """Returns the TranscriptCache to use, or None if caching is off."""
+    enabled = args.cache or args.cache_file or args.refresh or project_config.getboolean('cache', fallback=False)
+    if args.no_cache or not enabled:
+        return None
+    return openai_transcribe_cache.TranscriptCache(args.cache_file, args.cache_max_entries, args.refresh)
 
 def read_configuration(config_file, project):
     """Read the configuration file and return the project configuration."""
@@ -178,7 +641,29 @@ def parse_args():
     parser.add_argument('--config', type=str, help='Path to the configuration file.')
     parser.add_argument('--project', type=str, default=DEFAULT_PROJECT, help='Name of the project configuration to use from the config file.')
     parser.add_argument('--verbose', action='store_true', help='print progress for each file')
-    return parser.parse_args()
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='the number of chunks to upload at once')
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH_FILES, help='the number of files to prepare ahead of the one being transcribed')
+    parser.add_argument('--memory-limit', type=float, metavar='MB', default=DEFAULT_MEMORY_LIMIT_MB, help='hold exported chunks in up to this many megabytes of memory before writing them to scratch files')
+    parser.add_argument('--scratch-dir', type=str, metavar='DIR', help='make the scratch directory for chunks beyond the memory limit in DIR')
+    parser.add_argument('--max-retries', type=int, default=openai_retry.DEFAULT_MAX_RETRIES, help='retry rate limit and server errors up to this many times')
+    parser.add_argument('--cache', action='store_true', help='reuse transcripts of unchanged files and chunks from an on-disk cache')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the cache, even if the project configuration enables it')
+    parser.add_argument('--refresh', '--cache-refresh', action='store_true', help='transcribe every chunk again and replace its cached transcript')
+    parser.add_argument('--cache-file', type=str, help='path to the cache database (default: {})'.format(openai_transcribe_cache.default_cache_path(openai_transcribe_cache.DEFAULT_CACHE_NAME)))
+    parser.add_argument('--cache-max-entries', type=int, default=openai_transcribe_cache.DEFAULT_MAX_ENTRIES, help='the number of transcripts and of file manifests to keep in the cache')
+    parser.add_argument('--metrics', type=str, metavar='FILE', help='append timing and usage metrics to FILE, or write a Prometheus textfile if FILE ends in .prom')
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error('the number of jobs should be positive')
+    if args.max_retries < 0:
+        parser.error('the number of retries should be nonnegative')
+    if args.memory_limit < 0:
+        parser.error('the memory limit should be nonnegative')
+    if args.prefetch < 0:
+        parser.error('the number of files to prefetch should be nonnegative')
+    if args.cache_max_entries < 1:
+        parser.error('the number of cache entries should be positive')
+    return args
 
 def main():
     """Main program function."""
@@ -188,15 +673,41 @@ def main():
 
     args = parse_args()
 
+    # Record metrics until the end of the run, however it ends
+    if args.metrics:
+        openai_metrics.enable('openai-transcribe')
+        try:
+            run(args)
+        finally:
+            openai_metrics.write(args.metrics)
+    else:
+        run(args)
+
+def run(args):
+    """Transcribe the files given by the parsed command-line arguments."""
     # Load configuration
-    config_file = args.config if args.config else os.getenv('OPENAI_CONFIG', DEFAULT_CONFIG_FILE)
-    project_config = read_configuration(config_file, args.project)
+    with openai_metrics.stage('config'):
+        config_file = args.config if args.config else os.getenv('OPENAI_CONFIG', DEFAULT_CONFIG_FILE)
+        project_config = read_configuration(config_file, args.project)
 
     # Set the API key
+    with openai_metrics.stage('import_openai'):
+        import openai
     openai.api_key = project_config['api_key']
+    if project_config.get('api_base'):
+        openai.api_base = project_config['api_base']
 
     check_ffmpeg_installed()
-    handle_files(args.files, args.verbose)
+    cache = open_transcript_cache(args, project_config)
+    try:
+        succeeded = handle_files(args.files, args.verbose, openai_rate_limit.rate_limiter_from_config(project_config, WHISPER_MODE),
+                     args.jobs, args.max_retries, cache, args.prefetch,
+                     ChunkStore(int(args.memory_limit * 1000 * 1000), args.scratch_dir))
+    finally:
+        if cache is not None:
+            cache.close()
+    if not succeeded:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,116 @@
+"""
+Persistent transcript cache for openai-transcribe.
+
+Transcripts are stored in an SQLite database keyed by a SHA-256 hash of
+the chunk of audio that was uploaded, together with the model and the
+other API parameters, so the same audio is never paid for twice,
+whichever file it was cut from.
+
+For each input file the cache also keeps a manifest: the chunks the
+file was planned into and the key of each chunk transcribed so far. A
+manifest is found by the file's path, size and modification time and
+the planning parameters. A rerun on an unchanged file therefore skips
+looking for pauses and exports and uploads only the chunks that are
+still missing, and a file whose chunks were all transcribed costs no
+API calls at all.
+
+Each transcript is committed as soon as it arrives, so an interrupted
+or failed run loses nothing already paid for. The least recently used
+transcripts and manifests are evicted once the cache holds more than
+max_entries of either. The database is opened in WAL mode, so several
+processes can share one cache.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from .openai_tokens_cache import default_cache_path
+
+# Define constants
+DEFAULT_CACHE_NAME = 'transcripts.sqlite'
+DEFAULT_MAX_ENTRIES = 10000
+
+def canonical_json(value):
+    """Returns value as JSON with sorted keys and no extra whitespace."""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+def audio_key(data, params):
+    """Returns the SHA-256 hex digest of a chunk of audio, given as bytes, and the API parameters it is sent with."""
+    digest = hashlib.sha256(canonical_json(params).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(data)
+    return digest.hexdigest()
+
+def file_key(filename, params):
+    """Returns the SHA-256 hex digest of the path, size and modification time of filename and the planning parameters."""
+    stat = os.stat(filename)
+    identity = {"path": os.path.abspath(filename), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "params": params}
+    return hashlib.sha256(canonical_json(identity).encode('utf-8')).hexdigest()
+
+class TranscriptCache:
+    """SQLite cache of chunk transcripts and per-file chunk manifests, safe to share between threads and processes."""
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, refresh=False):
+        self.path = path or default_cache_path(DEFAULT_CACHE_NAME)
+        self.max_entries = max_entries
+        self.refresh = refresh
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        import sqlite3  # imported here to keep startup fast for runs without a cache
+        # Chunks are transcribed on several threads, which share the connection under a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            for table in ('transcripts', 'manifests'):
+                self.connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ('
+                                        'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                                        'created REAL NOT NULL, last_used REAL NOT NULL)')
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used)')
+
+    def _lookup(self, table, key):
+        if self.refresh:
+            return None
+        with self.lock:
+            row = self.connection.execute(f'SELECT value FROM {table} WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            with self.connection:
+                self.connection.execute(f'UPDATE {table} SET last_used = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def _store(self, table, key, value):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(f'INSERT OR REPLACE INTO {table} (key, value, created, last_used) VALUES (?, ?, ?, ?)',
+                                    (key, value, now, now))
+
+    def lookup(self, key):
+        """Returns the cached transcript for a chunk's audio key, or None on a miss."""
+        return self._lookup('transcripts', key)
+
+    def store(self, key, text):
+        """Stores the transcript text for a chunk's audio key."""
+        self._store('transcripts', key, text)
+
+    def lookup_manifest(self, filename, params):
+        """Returns the manifest of filename, planned with params, as a list of [start, length, key] chunks, or None on a miss.
+
+        The key of a chunk is None if it has not been transcribed yet.
+        """
+        value = self._lookup('manifests', file_key(filename, params))
+        return json.loads(value) if value is not None else None
+
+    def store_manifest(self, filename, params, chunks):
+        """Stores the manifest of filename, planned with params, given as a list of [start, length, key] chunks."""
+        self._store('manifests', file_key(filename, params), json.dumps(chunks))
+
+    def close(self):
+        """Evicts the least recently used transcripts and manifests beyond max_entries, and closes the database."""
+        with self.lock, self.connection:
+            for table in ('transcripts', 'manifests'):
+                self.connection.execute(f'DELETE FROM {table} WHERE rowid IN '
+                                        f'(SELECT rowid FROM {table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                                        (self.max_entries,))
+        self.connection.close()
@@ -0,0 +1,85 @@
+"""
+Chunk planning for openai-transcribe.
+
+A recording longer than the API's upload limit allows is sent in
+several chunks. plan_chunks() splits it into as few chunks as the limit
+allows at the audio's bitrate, so an hour of compact speech audio
+takes one request instead of six, and makes them about equally long,
+so the last one is never a sliver the API would reject. Each cut is
+moved back to the middle of the latest pause within a short window
+before its even share, so that no word is cut in two. It is a pure
+function of the duration, bitrate and pauses, so it can be checked
+without any audio at all.
+
+detect_silences() finds the pauses with ffmpeg's silencedetect filter.
+It can be tried on synthetic audio, for example a tone broken by a
+half second pause every seven seconds:
+
+    ffmpeg -f lavfi -i "aevalsrc='sin(440*2*PI*t)*gte(mod(t,7),0.5)':s=16000:d=600" tone.wav
+"""
+
+import bisect
+import math
+import re
+import subprocess
+
+# Define constants
+PLAN_VERSION = 2  # changes whenever plan_chunks() would cut the same audio differently
+MAX_CHUNK_BYTES = 24 * 1000 * 1000  # just under the API's 25 MB limit
+SILENCE_WINDOW = 30.0
+SILENCE_NOISE = '-35dB'
+SILENCE_DURATION = 0.3
+
+def plan_chunks(duration, bytes_per_second, silences=(), max_bytes=MAX_CHUNK_BYTES, window=SILENCE_WINDOW):
+    """Returns the (start, length) pairs, in seconds, of the chunks to split duration seconds of audio into.
+
+    The audio is split into the fewest chunks that hold at most
+    max_bytes each at bytes_per_second, of about equal length. Each cut
+    is made in the middle of the latest of the (start, end) silences
+    within window seconds, or half the chunk if that is shorter, before
+    the chunk's even share of the audio left, or at that point if there
+    is none.
+    """
+    max_length = max_bytes / bytes_per_second
+    if max_length <= window:
+        raise ValueError(f"chunks of {max_length:.1f} seconds are too short to look {window} seconds back for a silence")
+    cuts = sorted((start + end) / 2 for start, end in silences)
+    chunks = []
+    start = 0.0
+    while duration - start > max_length:
+        # Sharing what is left evenly keeps every chunk, the last included, at half the limit or more
+        count = math.ceil((duration - start) / max_length)
+        limit = start + (duration - start) / count
+        # An earlier cut must still leave no more than the other chunks can hold
+        earliest = max(limit - min(window, (limit - start) / 2), duration - (count - 1) * max_length)
+        # The latest cut at or before the limit, if it is within the window
+        index = bisect.bisect_right(cuts, limit) - 1
+        cut = cuts[index] if index >= 0 and cuts[index] >= earliest else limit
+        chunks.append((start, cut - start))
+        start = cut
+    chunks.append((start, duration - start))
+    return chunks
+
+def detect_silences(filename, duration=None, noise=SILENCE_NOISE, min_silence=SILENCE_DURATION):
+    """Returns the (start, end) times, in seconds, of the silences in the audio of a media file.
+
+    A silence still going on at the end of the audio ends at duration,
+    if given.
+    """
+    command = ['ffmpeg', '-hide_banner', '-nostats', '-i', filename, '-map', '0:a:0',
+               '-af', f"silencedetect=noise={noise}:d={min_silence}", '-f', 'null', '-']
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip()
+                           else f"ffmpeg exited with status {result.returncode}")
+    silences = []
+    start = None
+    for match in re.finditer(r'silence_(start|end): (-?[0-9.]+)', result.stderr):
+        if match.group(1) == 'start':
+            start = max(float(match.group(2)), 0.0)
+        elif start is not None:
+            silences.append((start, float(match.group(2))))
+            start = None
+    if start is not None and duration is not None:
+        silences.append((start, duration))
+    return silences
@@ -9,14 +9,14 @@ setup(
             "openai-chat = openai_misc_tools.openai_chat:main",
             "openai-tokens-count = openai_misc_tools.openai_tokens_count:main",
             "openai-tokens-head = openai_misc_tools.openai_tokens_head:main",
+            "openai-tokens-split = openai_misc_tools.openai_tokens_split:main",
+            "openai-tokens-serve = openai_misc_tools.openai_tokens_serve:main",
             "openai-transcribe = openai_misc_tools.openai_transcribe:main",
         ]
     },
     install_requires=[
         "configparser",
-        "moviepy",
         "openai",
-        "pydub",
         "tiktoken",
     ],
 )